@@ -8,6 +8,7 @@
 import os
 import json
 import time
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -18,6 +19,16 @@ except ImportError:
     print("❌ 请先安装 cozepy 库: pip install cozepy")
     exit(1)
 
+# 导入限速器、录制回放模块和看门狗
+try:
+    import douyin_cassette
+    import douyin_http
+    import douyin_ratelimit
+    import douyin_watchdog
+except ImportError:
+    print("❌ 无法导入 douyin_ratelimit/douyin_cassette/douyin_watchdog 模块，请确保文件存在")
+    exit(1)
+
 
 class AITalkGenerator:
     """AI打招呼话术生成器"""
@@ -31,7 +42,8 @@ class AITalkGenerator:
         # 初始化Coze客户端
         self.coze = Coze(
             auth=TokenAuth(token=self.coze_api_token), 
-            base_url=COZE_CN_BASE_URL
+            base_url=COZE_CN_BASE_URL,
+            http_client=douyin_http.coze_http_client()
         )
         
         # 目录配置
@@ -42,6 +54,9 @@ class AITalkGenerator:
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
         
+        # 每个文件在看门狗下处理，卡住的文件放到队尾重试
+        self.watchdog = douyin_watchdog.Watchdog()
+        
         # 统计信息
         self.stats = {
             "total_files": 0,
@@ -77,6 +92,32 @@ class AITalkGenerator:
         # 直接返回JSON内容，不添加任何其他提示词
         return json_content
     
+    def stream_chat(self, prompt: str) -> str:
+        """流式调用Coze对话，返回拼接后的回复"""
+        # 调用频率由限速器的coze配额控制
+        douyin_ratelimit.acquire('coze')
+        talk_content = ""
+        # 两个事件之间的间隔受httpx读取超时限制，整个对话另有总时限
+        deadline = time.monotonic() + douyin_http.COZE_TOTAL_TIMEOUT
+        for event in self.coze.chat.stream(
+            bot_id=self.bot_id,
+            user_id=self.user_id,
+            additional_messages=[
+                Message.build_user_question_text(prompt),
+            ],
+        ):
+            douyin_watchdog.beat()
+            if time.monotonic() > deadline:
+                raise douyin_http.DeadlineExceeded(f"Coze对话超过总时限 {douyin_http.COZE_TOTAL_TIMEOUT} 秒")
+            
+            if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
+                talk_content += event.message.content
+            
+            if event.event == ChatEventType.CONVERSATION_CHAT_COMPLETED:
+                self.log(f"API调用完成，token使用量: {event.chat.usage.token_count if event.chat.usage else '未知'}")
+                break
+        return talk_content
+    
     def generate_talk_text(self, json_content: str, nickname: str = "未知用户") -> Optional[str]:
         """使用Coze API生成打招呼话术"""
         try:
@@ -85,22 +126,10 @@ class AITalkGenerator:
             
             self.log(f"正在为用户 {nickname} 生成话术...")
             
-            # 调用Coze API
-            talk_content = ""
-            
-            for event in self.coze.chat.stream(
-                bot_id=self.bot_id,
-                user_id=self.user_id,
-                additional_messages=[
-                    Message.build_user_question_text(prompt),
-                ],
-            ):
-                if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
-                    talk_content += event.message.content
-                
-                if event.event == ChatEventType.CONVERSATION_CHAT_COMPLETED:
-                    self.log(f"API调用完成，token使用量: {event.chat.usage.token_count if event.chat.usage else '未知'}")
-                    break
+            # 调用Coze API，录制/回放模式下经过douyin_cassette
+            talk_content = douyin_cassette.get_cassette().call(
+                'coze', {'bot_id': self.bot_id, 'prompt': prompt}, lambda: self.stream_chat(prompt))
+            douyin_ratelimit.feedback('coze', True)
             
             # 清理生成的内容
             talk_content = talk_content.strip()
@@ -114,6 +143,7 @@ class AITalkGenerator:
                 
         except Exception as e:
             self.log(f"调用Coze API失败: {e}", "ERROR")
+            douyin_ratelimit.feedback('coze', False)
             return None
     
     def save_talk_text(self, talk_content: str, original_filename: str) -> bool:
@@ -169,9 +199,6 @@ class AITalkGenerator:
         # 保存话术
         success = self.save_talk_text(talk_content, json_filename)
         
-        # 添加延迟，避免API调用过频
-        time.sleep(2)
-        
         return success
     
     def get_user_json_files(self) -> List[str]:
@@ -205,11 +232,22 @@ class AITalkGenerator:
         
         self.log(f"找到 {len(json_files)} 个用户信息文件")
         
-        # 逐个处理文件
-        for i, json_filename in enumerate(json_files, 1):
+        # 逐个处理文件，超过时限没有进展的文件放到队尾重试
+        queue = deque((i, json_filename, 0) for i, json_filename in enumerate(json_files, 1))
+        while queue:
+            i, json_filename, attempts = queue.popleft()
             self.log(f"\n[{i}/{len(json_files)}] 开始处理: {json_filename}")
             
-            success = self.process_single_file(json_filename)
+            try:
+                success = self.watchdog.run('ai_talk', self.process_single_file, json_filename)
+            except douyin_watchdog.StageStalled as e:
+                if attempts < douyin_watchdog.MAX_REQUEUE:
+                    self.watchdog.requeued(e.stage)
+                    self.log(f"[{i}/{len(json_files)}] ⏱️ {e}，放到队尾重试", "WARNING")
+                    queue.append((i, json_filename, attempts + 1))
+                    continue
+                self.log(f"[{i}/{len(json_files)}] ❌ {e}", "ERROR")
+                success = False
             
             if success:
                 self.stats["success_count"] += 1
@@ -241,6 +279,8 @@ class AITalkGenerator:
         self.log(f"生成成功: {stats['success_count']} ✅")
         self.log(f"生成失败: {stats['failed_count']} ❌")
         self.log(f"总处理时长: {duration:.2f} 秒")
+        for stage, counts in self.watchdog.stats().items():
+            self.log(f"阶段 {stage}: 执行 {counts['runs']} 次, 超时 {counts['timeouts']} 次, 重排 {counts['requeued']} 次")
         
         if stats["total_files"] > 0:
             success_rate = (stats["success_count"] / stats["total_files"] * 100)
@@ -5,14 +5,29 @@
 基于auto_cookie_douyin.py，自动获取cookie并配置到config/cookie_config.txt
 """
 
+import glob
 import json
 import os
 import re
 import sys
+import threading
+import time
+from concurrent.futures import Future, wait
 from datetime import datetime
 from typing import Dict, Optional, Union
 from urllib.parse import urlparse
 
+try:
+    import douyin_cookie_store
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_cookie_store
+
+# 浏览器探测结果，进程内共享：浏览器名 -> {"signature", "time", "cookies", "timed_out"}
+# cookies为该浏览器中douyin.com的Cookie列表，探测失败或超时为None
+_probe_cache = {}
+_probe_lock = threading.Lock()
+
 
 class DouyinCookieConfigManager:
     """抖音Cookie配置管理器 - 自动配置到config文件"""
@@ -29,6 +44,55 @@ class DouyinCookieConfigManager:
         "Chromium": "chromium",
     }
     
+    # 各浏览器Cookie数据库的位置(Windows/macOS/Linux)，文件变化时才重新探测
+    COOKIE_DB_GLOBS = {
+        "Chrome": [
+            "%LOCALAPPDATA%/Google/Chrome/User Data/*/Network/Cookies",
+            "~/Library/Application Support/Google/Chrome/*/Cookies",
+            "~/.config/google-chrome/*/Cookies",
+        ],
+        "Edge": [
+            "%LOCALAPPDATA%/Microsoft/Edge/User Data/*/Network/Cookies",
+            "~/Library/Application Support/Microsoft Edge/*/Cookies",
+            "~/.config/microsoft-edge/*/Cookies",
+        ],
+        "Firefox": [
+            "%APPDATA%/Mozilla/Firefox/Profiles/*/cookies.sqlite",
+            "~/Library/Application Support/Firefox/Profiles/*/cookies.sqlite",
+            "~/.mozilla/firefox/*/cookies.sqlite",
+        ],
+        "Opera": [
+            "%APPDATA%/Opera Software/Opera Stable/Network/Cookies",
+            "~/Library/Application Support/com.operasoftware.Opera/Cookies",
+            "~/.config/opera/Cookies",
+        ],
+        "Brave": [
+            "%LOCALAPPDATA%/BraveSoftware/Brave-Browser/User Data/*/Network/Cookies",
+            "~/Library/Application Support/BraveSoftware/Brave-Browser/*/Cookies",
+            "~/.config/BraveSoftware/Brave-Browser/*/Cookies",
+        ],
+        "Arc": [
+            "%LOCALAPPDATA%/Packages/TheBrowserCompany.Arc*/LocalCache/Local/Arc/User Data/*/Network/Cookies",
+            "~/Library/Application Support/Arc/User Data/*/Cookies",
+        ],
+        "Vivaldi": [
+            "%LOCALAPPDATA%/Vivaldi/User Data/*/Network/Cookies",
+            "~/Library/Application Support/Vivaldi/*/Cookies",
+            "~/.config/vivaldi/*/Cookies",
+        ],
+        "Chromium": [
+            "%LOCALAPPDATA%/Chromium/User Data/*/Network/Cookies",
+            "~/Library/Application Support/Chromium/*/Cookies",
+            "~/.config/chromium/*/Cookies",
+        ],
+    }
+    
+    # 单个浏览器探测的最长等待时间(秒)，超时的浏览器本次视为不可用
+    PROBE_TIMEOUT = float(os.environ.get("DOUYIN_BROWSER_PROBE_TIMEOUT", "15"))
+    
+    # 找不到Cookie数据库文件时无法判断是否变化，探测结果最多复用这么久(秒)；探测超时的浏览器同样在这段时间内不再探测
+    PROBE_TTL = 600
+    
     # Cookie验证必需的关键字段
     REQUIRED_FIELDS = ["odin_tt", "passport_csrf_token"]
     
@@ -39,9 +103,15 @@ class DouyinCookieConfigManager:
         # 配置文件路径
         self.config_dir = os.path.join(os.path.dirname(__file__), "config")
         self.cookie_config_file = os.path.join(self.config_dir, "cookie_config.txt")
-        self.backup_file = os.path.join(self.config_dir, "cookie_backup.json")
+        self.cookie_store_file = os.path.join(self.config_dir, "cookie_store.json")
         self.log_file = "cookie_config_log.txt"
         
+        # 结构化cookie存储(含历史备份)，文本配置文件只用于导入/导出
+        self.cookie_store = douyin_cookie_store.CookieStore(self.cookie_store_file, legacy_text=self.cookie_config_file)
+        
+        # 最近一次从浏览器读取的各Cookie过期时间(unix秒，会话Cookie为None)
+        self.cookie_expires = {}
+        
         # 确保config目录存在
         os.makedirs(self.config_dir, exist_ok=True)
         
@@ -83,28 +153,118 @@ class DouyinCookieConfigManager:
         
         return None
     
-    def get_available_browsers(self) -> Dict[str, bool]:
-        """检查可用的浏览器"""
-        available = {}
+    def cookie_db_signature(self, browser_name: str) -> Optional[tuple]:
+        """
+        浏览器Cookie数据库文件的(路径, 修改时间, 大小)，找不到文件时返回None
+        同时包含-wal/-journal文件：WAL模式下(例如Firefox)新cookie先写入-wal，主文件要到checkpoint才变化
+        """
+        files = []
+        for pattern in self.COOKIE_DB_GLOBS.get(browser_name, []):
+            pattern = os.path.expanduser(os.path.expandvars(pattern))
+            if "%" in pattern:
+                # 当前系统没有该环境变量
+                continue
+            for db_path in glob.glob(pattern):
+                for path in (db_path, db_path + "-wal", db_path + "-journal"):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(files)) or None
+    
+    def probe_browser(self, browser_name: str) -> list:
+        """读取指定浏览器中douyin.com的Cookie(打开并解密Cookie数据库)"""
+        import rookiepy
         
-        try:
-            import rookiepy
+        func = getattr(rookiepy, self.SUPPORT_BROWSERS[browser_name])
+        return func(domains=["douyin.com"])
+    
+    def start_probe(self, browser_name: str) -> Future:
+        """在守护线程中探测浏览器，卡住的线程不会阻止进程退出"""
+        future = Future()
+        
+        def target():
+            try:
+                future.set_result(self.probe_browser(browser_name))
+            except BaseException as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=target, name=f"browser-probe-{browser_name}", daemon=True).start()
+        return future
+    
+    def probe_browsers(self, browser_names=None) -> Dict[str, Optional[list]]:
+        """
+        并行探测浏览器，返回{浏览器: Cookie列表或None}
+        Cookie数据库没有变化的浏览器直接使用上次的结果，超时的浏览器返回None并在PROBE_TTL内不再探测
+        """
+        browser_names = list(browser_names or self.SUPPORT_BROWSERS)
+        now = time.time()
+        results = {}
+        pending = {}
+        
+        with _probe_lock:
+            for browser_name in browser_names:
+                signature = self.cookie_db_signature(browser_name)
+                entry = _probe_cache.get(browser_name)
+                if entry and entry["timed_out"]:
+                    fresh = now - entry["time"] < self.PROBE_TTL
+                else:
+                    fresh = entry and entry["signature"] == signature and (
+                        signature is not None or now - entry["time"] < self.PROBE_TTL)
+                if fresh:
+                    results[browser_name] = entry["cookies"]
+                else:
+                    pending[browser_name] = signature
+            
+            if not pending:
+                return results
+            
+            start = time.perf_counter()
+            # 卡住的探测线程无法终止，不等待它们结束(守护线程，进程退出时不会被join)
+            futures = {self.start_probe(name): name for name in pending}
+            done, not_done = wait(futures, timeout=self.PROBE_TIMEOUT)
             
-            for browser_name, browser_func in self.SUPPORT_BROWSERS.items():
+            for future in done:
+                browser_name = futures[future]
                 try:
-                    # 测试浏览器是否可用
-                    func = getattr(rookiepy, browser_func)
-                    # 尝试获取一个测试域名的cookie来检查浏览器是否可用
-                    func(domains=["douyin.com"])
-                    available[browser_name] = True
+                    cookies = future.result()
+                except ImportError:
+                    raise
                 except Exception:
-                    available[browser_name] = False
-                    
+                    cookies = None
+                _probe_cache[browser_name] = {
+                    "signature": pending[browser_name],
+                    "time": now,
+                    "cookies": cookies,
+                    "timed_out": False,
+                }
+                results[browser_name] = cookies
+            
+            for future in not_done:
+                browser_name = futures[future]
+                self.log(f"探测 {browser_name} 超过 {self.PROBE_TIMEOUT} 秒，{self.PROBE_TTL} 秒内不再尝试", "WARNING")
+                _probe_cache[browser_name] = {
+                    "signature": pending[browser_name],
+                    "time": now,
+                    "cookies": None,
+                    "timed_out": True,
+                }
+                results[browser_name] = None
+            
+            self.log(f"并行探测 {len(pending)} 个浏览器，耗时 {time.perf_counter() - start:.2f}s")
+        
+        return {name: results[name] for name in browser_names}
+    
+    def get_available_browsers(self) -> Dict[str, bool]:
+        """检查可用的浏览器(包含抖音Cookie的浏览器为True)"""
+        try:
+            import rookiepy
         except ImportError:
             self.log("rookiepy 库未安装，请先安装: pip install rookiepy", "ERROR")
             return {}
-            
-        return available
+        
+        return {name: bool(cookies) for name, cookies in self.probe_browsers().items()}
     
     def get_cookies_from_browser(self, browser_name: str) -> Optional[Dict[str, str]]:
         """从指定浏览器获取抖音Cookie"""
@@ -115,13 +275,10 @@ class DouyinCookieConfigManager:
                 self.log(f"不支持的浏览器: {browser_name}", "ERROR")
                 return None
                 
-            browser_func = self.SUPPORT_BROWSERS[browser_name]
-            func = getattr(rookiepy, browser_func)
-            
             self.log(f"正在从 {browser_name} 浏览器获取Cookie...")
             
-            # 获取douyin.com域名的cookie
-            cookies = func(domains=["douyin.com"])
+            # 获取douyin.com域名的cookie，数据库没有变化时复用探测结果
+            cookies = self.probe_browsers([browser_name])[browser_name]
             
             if not cookies:
                 self.log(f"从 {browser_name} 未找到抖音Cookie", "WARNING")
@@ -129,6 +286,7 @@ class DouyinCookieConfigManager:
                 
             # 转换为字典格式
             cookie_dict = {cookie["name"]: cookie["value"] for cookie in cookies}
+            self.cookie_expires = {cookie["name"]: cookie.get("expires") for cookie in cookies}
             
             self.log(f"成功从 {browser_name} 获取到 {len(cookie_dict)} 个Cookie字段")
             return cookie_dict
@@ -175,115 +333,14 @@ class DouyinCookieConfigManager:
         """将Cookie字典转换为字符串格式"""
         return "; ".join([f"{k}={v}" for k, v in cookie_dict.items()])
     
-    def read_config_file(self) -> str:
-        """读取配置文件内容"""
-        if not os.path.exists(self.cookie_config_file):
-            # 如果配置文件不存在，创建默认配置
-            self.create_default_config()
-        
-        try:
-            with open(self.cookie_config_file, "r", encoding="utf-8") as f:
-                return f.read()
-        except Exception as e:
-            self.log(f"读取配置文件失败: {e}", "ERROR")
-            return ""
-    
-    def create_default_config(self):
-        """创建默认配置文件"""
-        default_config = """# 抖音Cookie配置文件
-# 使用说明：
-# 1. 将您的完整cookie字符串粘贴到下面的cookie行
-# 2. 或者设置浏览器自动获取方式：chrome 或 edge
-# 3. 以 # 开头的行为注释行，会被忽略
-
-# 方式1：直接填写cookie字符串（推荐）
-# 请将完整的cookie字符串粘贴到下面（去掉前面的#号）：
-#cookie=your_cookie_string_here
-
-# 方式2：自动从浏览器获取（备用）
-# 支持 chrome 或 edge
-browser=chrome
-
-# 注意事项：
-# - Cookie有效期较短，通常几小时到几天
-# - 如果获取失败，请重新登录抖音网页版获取新的cookie
-# - 建议定期更新cookie以保持有效性
-"""
-        with open(self.cookie_config_file, "w", encoding="utf-8") as f:
-            f.write(default_config)
-        
-        self.log(f"已创建默认配置文件: {self.cookie_config_file}")
-    
     def update_config_file(self, cookie_string: str, browser_name: str = "chrome"):
-        """更新配置文件中的cookie"""
-        # 备份原配置文件
-        self.backup_config()
-        
-        # 读取原配置文件
-        content = self.read_config_file()
-        lines = content.split('\n')
-        
-        # 更新时间戳
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 构建新的配置内容
-        new_lines = []
-        cookie_updated = False
-        
-        for line in lines:
-            if line.strip().startswith('cookie=') or line.strip().startswith('#cookie='):
-                # 更新cookie行
-                new_lines.append(f"cookie={cookie_string}")
-                cookie_updated = True
-            elif line.strip().startswith('browser='):
-                # 更新浏览器行
-                new_lines.append(f"browser={browser_name}")
-            elif line.strip().startswith('# 注意事项：'):
-                # 在注意事项前添加更新时间
-                new_lines.append(f"# 最后更新时间：{timestamp}")
-                new_lines.append(line)
-            else:
-                new_lines.append(line)
-        
-        # 如果没找到cookie行，在合适位置添加
-        if not cookie_updated:
-            # 在第一个注释块后添加cookie
-            insert_index = 0
-            for i, line in enumerate(new_lines):
-                if line.strip().startswith('# 方式1：'):
-                    insert_index = i + 2
-                    break
-            
-            new_lines.insert(insert_index, f"cookie={cookie_string}")
-        
-        # 写入更新后的配置
-        with open(self.cookie_config_file, "w", encoding="utf-8") as f:
-            f.write('\n'.join(new_lines))
+        """更新cookie存储，原cookie进入历史记录，并按需导出文本配置文件"""
+        doc = self.cookie_store.update(cookie_string, browser_name, expires=self.cookie_expires)
+        self.log(f"✅ Cookie已更新到: {self.cookie_store_file}（历史备份 {len(doc['history'])} 份）")
         
-        self.log(f"✅ Cookie已更新到配置文件: {self.cookie_config_file}")
-    
-    def backup_config(self):
-        """备份当前配置"""
-        if os.path.exists(self.cookie_config_file):
-            try:
-                # 读取当前配置
-                with open(self.cookie_config_file, "r", encoding="utf-8") as f:
-                    current_config = f.read()
-                
-                # 创建备份数据
-                backup_data = {
-                    "timestamp": datetime.now().isoformat(),
-                    "config_content": current_config
-                }
-                
-                # 保存备份
-                with open(self.backup_file, "w", encoding="utf-8") as f:
-                    json.dump(backup_data, f, ensure_ascii=False, indent=2)
-                
-                self.log(f"配置文件已备份到: {self.backup_file}")
-                
-            except Exception as e:
-                self.log(f"备份配置文件失败: {e}", "WARNING")
+        if douyin_cookie_store.EXPORT_TEXT:
+            self.cookie_store.export_text(self.cookie_config_file, doc)
+            self.log(f"已导出到配置文件: {self.cookie_config_file}")
     
     def save_cookie_info(self, cookie_dict: Dict[str, str], user_url: str = "", browser_name: str = ""):
         """保存详细的cookie信息到JSON文件"""
@@ -382,38 +439,28 @@ browser=chrome
         """显示当前配置状态"""
         self.log("\n=== 当前配置状态 ===")
         
-        if os.path.exists(self.cookie_config_file):
-            self.log(f"✅ 配置文件存在: {self.cookie_config_file}")
-            
-            # 读取配置内容
-            content = self.read_config_file()
-            lines = content.split('\n')
-            
-            cookie_found = False
-            browser_setting = "未设置"
-            
-            for line in lines:
-                if line.strip().startswith('cookie=') and not line.strip().startswith('#cookie='):
-                    cookie_value = line.split('=', 1)[1] if '=' in line else ""
-                    if cookie_value and cookie_value != "your_cookie_string_here":
-                        cookie_found = True
-                        self.log(f"✅ 发现Cookie配置（长度: {len(cookie_value)}）")
-                elif line.strip().startswith('browser='):
-                    browser_setting = line.split('=', 1)[1] if '=' in line else "未设置"
-            
-            if not cookie_found:
-                self.log("❌ 未找到有效的Cookie配置")
-            
-            self.log(f"浏览器设置: {browser_setting}")
-            
+        if os.path.exists(self.cookie_store_file):
+            self.log(f"✅ Cookie存储存在: {self.cookie_store_file}")
+        elif os.path.exists(self.cookie_config_file):
+            self.log(f"✅ 配置文件存在: {self.cookie_config_file}（首次更新时导入Cookie存储）")
         else:
-            self.log(f"❌ 配置文件不存在: {self.cookie_config_file}")
+            self.log(f"❌ 配置文件不存在: {self.cookie_store_file}")
+            return
+        
+        doc = self.cookie_store.load()
+        if doc["cookie"]:
+            self.log(f"✅ 发现Cookie配置（长度: {len(doc['cookie'])}）")
+            self.log(f"最后更新时间: {doc['updated_at'] or '未知'}")
+        else:
+            self.log("❌ 未找到有效的Cookie配置")
+        
+        self.log(f"浏览器设置: {doc['browser'] or '未设置'}")
         
-        # 检查备份文件
-        if os.path.exists(self.backup_file):
-            self.log(f"✅ 备份文件存在: {self.backup_file}")
+        # 检查历史备份
+        if doc["history"]:
+            self.log(f"✅ 历史备份: {len(doc['history'])} 份（最多保留 {self.cookie_store.history_size} 份）")
         else:
-            self.log("❌ 无备份文件")
+            self.log("❌ 无历史备份")
     
     def show_help(self):
         """显示帮助信息"""
@@ -423,8 +470,8 @@ browser=chrome
 功能：
 - 自动从浏览器获取抖音Cookie
 - 验证Cookie有效性和登录状态
-- 自动配置到 {self.cookie_config_file}
-- 备份原有配置，防止数据丢失
+- 自动配置到 {self.cookie_store_file}，并导出到 {self.cookie_config_file}
+- 保留最近几份历史Cookie，防止数据丢失
 
 使用方法：
 1. 在浏览器中登录抖音账号
@@ -439,11 +486,11 @@ browser=chrome
 - Windows系统需要管理员权限运行
 - 确保已安装 rookiepy 库: pip install rookiepy
 - 需要先在浏览器中登录抖音账号
-- 程序会自动备份原配置文件
+- 程序会自动备份原有Cookie
 
 输出文件：
-- {self.cookie_config_file}: Cookie配置文件
-- {self.backup_file}: 配置备份文件
+- {self.cookie_store_file}: Cookie存储（含历史备份）
+- {self.cookie_config_file}: Cookie配置文件（文本格式，导入/导出用）
 - {self.log_file}: 运行日志文件
 
 命令：
@@ -498,7 +545,7 @@ def main():
     if success:
         print("\n✅ Cookie配置成功！")
         print(f"配置文件: {manager.cookie_config_file}")
-        print(f"备份文件: {manager.backup_file}")
+        print(f"Cookie存储: {manager.cookie_store_file}")
         print(f"日志文件: {manager.log_file}")
         print("\n现在可以使用配置文件中的Cookie进行抖音数据获取了！")
     else:
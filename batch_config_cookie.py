@@ -9,10 +9,21 @@ import json
 import os
 import re
 import sys
+import threading
 import time
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Union
 
+# 导入限速器、错误分类、客户端注册表和登录状态缓存
+try:
+    import douyin_clients
+    import douyin_errors
+    import douyin_login
+    import douyin_ratelimit
+except ImportError:
+    print("❌ 无法导入 douyin_ratelimit/douyin_errors/douyin_clients/douyin_login 模块，请确保文件存在")
+    sys.exit(1)
+
 # 导入原有的配置管理器
 try:
     from auto_config_cookie import DouyinCookieConfigManager
@@ -32,6 +43,9 @@ class BatchDouyinCookieManager(DouyinCookieConfigManager):
         self.batch_log_file = "batch_cookie_config_log.txt"
         self.batch_result_file = os.path.join(self.config_dir, "batch_results.json")
         
+        # 最近一次配置成功的Cookie字符串
+        self.current_cookie = None
+        
         # 批量处理统计
         self.batch_stats = {
             "total_urls": 0,
@@ -178,6 +192,7 @@ class BatchDouyinCookieManager(DouyinCookieConfigManager):
                     
                     # 更新配置文件
                     self.update_config_file(cookie_string, browser_name.lower())
+                    self.current_cookie = cookie_string
                     
                     # 保存详细信息
                     self.save_cookie_info(cookie_dict, url, browser_name)
@@ -277,8 +292,14 @@ class BatchDouyinCookieManager(DouyinCookieConfigManager):
         
         self.batch_log(f"准备处理 {len(urls)} 个链接")
         
+        # delay_seconds为相邻链接开始处理的最小间隔，处理耗时已超过间隔时不再额外等待
+        if delay_seconds > 0:
+            douyin_ratelimit.configure('url', 1 / delay_seconds)
+        
         # 处理每个URL
         for index, url in enumerate(urls, 1):
+            if delay_seconds > 0:
+                douyin_ratelimit.acquire('url')
             result = self.process_single_url(url, index, len(urls))
             self.batch_stats["results"].append(result)
             
@@ -286,11 +307,6 @@ class BatchDouyinCookieManager(DouyinCookieConfigManager):
                 self.batch_stats["successful"] += 1
             else:
                 self.batch_stats["failed"] += 1
-            
-            # 如果不是最后一个URL，添加延迟避免频繁请求
-            if index < len(urls) and delay_seconds > 0:
-                self.batch_log(f"等待 {delay_seconds} 秒后处理下一个链接...")
-                time.sleep(delay_seconds)
         
         # 完成处理
         self.batch_stats["end_time"] = datetime.now().isoformat()
@@ -332,7 +348,7 @@ class BatchDouyinCookieManager(DouyinCookieConfigManager):
 
 功能：
 - 从 {self.urls_config_file} 批量读取抖音用户链接
-- 自动获取Cookie并配置到 {self.cookie_config_file}
+- 自动获取Cookie并配置到 {self.cookie_store_file}
 - 支持多个链接的批量处理
 - 新配置会覆盖原配置
 - 详细的处理日志和结果统计
@@ -354,7 +370,8 @@ URLs配置文件格式：
 - python batch_config_cookie.py help      # 显示帮助
 
 输出文件：
-- {self.cookie_config_file}: Cookie配置文件
+- {self.cookie_store_file}: Cookie存储（含历史备份）
+- {self.cookie_config_file}: Cookie配置文件（文本格式，导入/导出用）
 - {self.batch_result_file}: 批量处理结果
 - {self.batch_log_file}: 批量处理日志
 
@@ -367,6 +384,147 @@ URLs配置文件格式：
         print(help_text)
 
 
+class CookieLifecycle:
+    """
+    Cookie生命周期管理：一次运行中只从浏览器获取并验证一次，之后的链接直接复用内存中的Cookie
+    只有请求因Cookie失效而失败(report_failure)、登录检查未通过或登录态Cookie临近过期时才重新获取
+    临近过期重新获取到的仍是同一Cookie时继续使用，到预测的失效时间前不再重复获取
+    已登录的Cookie由后台线程(start_refresher)在登录检查结果过期前重新检查，复用时只读缓存
+    """
+    
+    # 距离过期不足该秒数时提前重新获取
+    REFRESH_MARGIN = douyin_login.REFRESH_MARGIN
+    
+    def __init__(self, manager: BatchDouyinCookieManager = None):
+        self.manager = manager or BatchDouyinCookieManager()
+        self.login = douyin_login.get_cache()
+        self.lock = threading.RLock()
+        self.refresher = None
+        self.cookie = None
+        self.cookie_expires = {}
+        self.expires = None
+        self.renewed_expires = None  # 临近过期时重新获取过、浏览器中没有更新Cookie的过期时间
+        self.result = None
+        self.stats = {"acquired": 0, "reused": 0, "invalidated": 0, "login_failed": 0}
+    
+    def expiring(self) -> bool:
+        if self.expires is None:
+            return False
+        if self.expires == self.renewed_expires:
+            return time.time() >= self.expires
+        return self.expires - time.time() < self.REFRESH_MARGIN
+    
+    def logged_in(self) -> bool:
+        """
+        获取时已登录的Cookie是否仍通过登录检查(优先使用缓存的结果)，未登录获取的Cookie不检查
+        检查请求失败时无法判断，按仍有效处理
+        """
+        if not self.result or not self.result.get("logged_in"):
+            return True
+        try:
+            return self.login.is_valid(self.cookie, self.cookie_expires)
+        except Exception as e:
+            self.manager.batch_log(f"登录检查失败，暂按有效处理: {e}", "WARNING")
+            return True
+    
+    def ensure(self, url: str, index: int, total: int) -> Dict:
+        """
+        返回与process_single_url相同格式的结果，复用已有Cookie时result["cached"]为True
+        """
+        with self.lock:
+            if self.cookie and not self.expiring():
+                if self.logged_in():
+                    self.stats["reused"] += 1
+                    return dict(self.result, url=url, index=index, timestamp=datetime.now().isoformat(),
+                                cached=True, message="复用已配置的Cookie")
+                self.stats["login_failed"] += 1
+                self.invalidate("登录检查未通过")
+            renewing = bool(self.cookie)
+            if renewing:
+                self.manager.batch_log(f"[{index}/{total}] Cookie即将过期，重新获取")
+            
+            result = self.manager.process_single_url(url, index, total)
+            if renewing and result["success"] and self.manager.current_cookie == self.cookie:
+                # 浏览器中还没有新的Cookie：保留当前Cookie和登录缓存，之后由登录检查和后台线程判断是否掉线
+                self.cookie_expires = dict(self.manager.cookie_expires)
+                self.expires = douyin_login.predict_expiry(douyin_login.LoginCache.parse(self.cookie), self.cookie_expires)
+                self.renewed_expires = self.expires
+                self.stats["reused"] += 1
+                return dict(self.result, url=url, index=index, timestamp=datetime.now().isoformat(),
+                            cached=True, message="浏览器中没有更新的Cookie，继续使用当前Cookie")
+            if renewing:
+                self.invalidate()
+            if result["success"] and self.manager.current_cookie:
+                self.cookie = self.manager.current_cookie
+                self.cookie_expires = dict(self.manager.cookie_expires)
+                self.expires = douyin_login.predict_expiry(douyin_login.LoginCache.parse(self.cookie), self.cookie_expires)
+                self.result = result
+                self.stats["acquired"] += 1
+                if not self.logged_in():
+                    # 浏览器中的登录已失效，Cookie仍可匿名使用
+                    self.stats["login_failed"] += 1
+                    self.manager.batch_log(f"[{index}/{total}] ⚠️ Cookie未通过登录检查，请在浏览器中重新登录抖音", "WARNING")
+                    self.result = dict(result, logged_in=False)
+                    result = self.result
+            return result
+    
+    def invalidate(self, reason: str = ""):
+        """丢弃当前Cookie，下一个链接重新从浏览器获取"""
+        with self.lock:
+            if self.cookie:
+                if reason:
+                    self.manager.batch_log(f"Cookie已失效({reason})，下一个链接将重新获取", "WARNING")
+                douyin_clients.invalidate(self.cookie)
+                self.login.invalidate(self.cookie)
+                self.stats["invalidated"] += 1
+            self.cookie = None
+            self.cookie_expires = {}
+            self.expires = None
+            self.renewed_expires = None
+            self.result = None
+    
+    def start_refresher(self):
+        """启动后台登录检查，重复调用只启动一次"""
+        if self.refresher is None:
+            self.refresher = douyin_login.Refresher(self.refresh_source, self.refresh_failed).start()
+        return self.refresher
+    
+    def refresh_source(self):
+        with self.lock:
+            if self.result and self.result.get("logged_in"):
+                return self.cookie, self.cookie_expires
+            return None, None
+    
+    def refresh_failed(self, cookie: str, reason: str):
+        with self.lock:
+            if cookie == self.cookie:
+                self.stats["login_failed"] += 1
+                self.invalidate(reason)
+    
+    def report_failure(self, client) -> bool:
+        """
+        请求失败后调用，返回是否判定为Cookie失效(并已丢弃当前Cookie)
+        client记录了last_error时只在登录失效时丢弃；没有错误信息的客户端(例如douyin-4的DouyinUserInfo)
+        无法区分原因，只有以登录状态获取的Cookie重新检查确认已掉线时才丢弃，其他情况不算Cookie失效
+        """
+        if hasattr(client, "last_error"):
+            if not douyin_errors.is_auth_error(client.last_error):
+                return False
+            reason = str(client.last_error)
+        else:
+            if not self.cookie or not self.result or not self.result.get("logged_in"):
+                return False
+            try:
+                if self.login.is_valid(self.cookie, self.cookie_expires, force=True):
+                    return False
+            except Exception as e:
+                self.manager.batch_log(f"登录检查失败，不判定为Cookie失效: {e}", "WARNING")
+                return False
+            reason = "登录检查未通过"
+        self.invalidate(reason)
+        return True
+
+
 def main():
     """主函数"""
     manager = BatchDouyinCookieManager()
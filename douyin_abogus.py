@@ -0,0 +1,430 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_abogus.py
+@Desc    :   js/douyin.js中sign_datail/sign_reply的纯Python实现
+             字符串统一按JS的UTF-16码元处理，保证与JS逐字节一致
+'''
+import functools
+import hashlib
+import random
+import time
+
+MASK = 0xFFFFFFFF
+
+ALPHABETS = {
+    "s0": "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=",
+    "s1": "Dkdpgh4ZKsQB80/Mfvw36XI1R25+WUAlEi7NLboqYTOPuzmFjJnryx9HVGcaStCe=",
+    "s2": "Dkdpgh4ZKsQB80/Mfvw36XI1R25-WUAlEi7NLboqYTOPuzmFjJnryx9HVGcaStCe=",
+    "s3": "ckdp1h4ZKsUB80/Mfvw36XIgR25+WQAlEi7NLboqYTOPuzmFjJnryx9HVGDaStCe",
+    "s4": "Dkdpgh2ZmsQB80/MfvV36XI1R45-WUAlEixNLwoqYTOPuzKFjJnry79HbGcaStCe",
+}
+
+WINDOW_ENV_STR = "1536|747|1536|834|0|30|0|0|1536|834|1536|864|1525|747|24|24|Win32"
+
+ARGUMENTS_DETAIL = (0, 1, 14)
+ARGUMENTS_REPLY = (0, 1, 8)
+
+PAGE_ID = 6241
+AID = 6383
+
+
+def to_codes(s: str) -> list:
+    """字符串转为JS的charCodeAt序列(UTF-16码元)"""
+    data = s.encode('utf-16-le', 'surrogatepass')
+    return [data[i] | data[i + 1] << 8 for i in range(0, len(data), 2)]
+
+
+def utf8_bytes(s: str) -> list:
+    """等价于JS中encodeURIComponent后还原%XX得到的字节"""
+    return list(s.encode('utf-8'))
+
+
+def le(e: int, r: int) -> int:
+    r %= 32
+    e &= MASK
+    return ((e << r) | (e >> (32 - r))) & MASK
+
+
+T_J = [le(2043430169 if j < 16 else 2055708042, j) for j in range(64)]
+
+
+class SM3(object):
+    """
+    与douyin.js中SM3对象行为一致(reset/write/sum/_compress/_fill)
+    """
+
+    IV = (1937774191, 1226093241, 388252375, 3666478592,
+          2842636476, 372324522, 3817729613, 2969243214)
+
+    def __init__(self):
+        self.reg = []
+        self.chunk = []
+        self.size = 0
+        self.reset()
+
+    def reset(self):
+        self.reg = list(self.IV)
+        self.chunk = []
+        self.size = 0
+
+    def write(self, e):
+        a = utf8_bytes(e) if isinstance(e, str) else list(e)
+        self.size += len(a)
+        f = 64 - len(self.chunk)
+        if len(a) < f:
+            self.chunk = self.chunk + a
+        else:
+            self.chunk = self.chunk + a[:f]
+            while len(self.chunk) >= 64:
+                self._compress(self.chunk)
+                self.chunk = a[f:min(f + 64, len(a))] if f < len(a) else []
+                f += 64
+
+    def sum(self, e=None, t=None):
+        # JS中空字符串为假值，不会触发reset/write
+        if e:
+            self.reset()
+            self.write(e)
+        self._fill()
+        for f in range(0, len(self.chunk), 64):
+            self._compress(self.chunk[f:f + 64])
+        if t == 'hex':
+            i = ''.join(f'{v:08x}' for v in self.reg)
+        else:
+            i = []
+            for c in self.reg:
+                i += [(c >> 24) & 255, (c >> 16) & 255, (c >> 8) & 255, c & 255]
+        self.reset()
+        return i
+
+    def _compress(self, t):
+        # 循环左移已内联，避免热点路径上的函数调用
+        w = [(t[i] << 24) | (t[i + 1] << 16) | (t[i + 2] << 8) | t[i + 3] for i in range(0, 64, 4)]
+        for n in range(16, 68):
+            x = w[n - 3]
+            x = w[n - 16] ^ w[n - 9] ^ (((x << 15) | (x >> 17)) & MASK)
+            y = w[n - 13]
+            w.append(x ^ (((x << 15) | (x >> 17)) & MASK) ^ (((x << 23) | (x >> 9)) & MASK)
+                     ^ (((y << 7) | (y >> 25)) & MASK) ^ w[n - 6])
+
+        a, b, c, d, e, f, g, h = self.reg
+        for j in range(64):
+            a12 = ((a << 12) | (a >> 20)) & MASK
+            o = (a12 + e + T_J[j]) & MASK
+            o = ((o << 7) | (o >> 25)) & MASK
+            if j < 16:
+                ff = a ^ b ^ c
+                gg = e ^ f ^ g
+            else:
+                ff = (a & b) | (a & c) | (b & c)
+                gg = (e & f) | (~e & g)
+            u = (ff + d + (o ^ a12) + (w[j] ^ w[j + 4])) & MASK
+            v = (gg + h + o + w[j]) & MASK
+            d = c
+            c = ((b << 9) | (b >> 23)) & MASK
+            b = a
+            a = u
+            h = g
+            g = ((f << 19) | (f >> 13)) & MASK
+            f = e
+            e = v ^ (((v << 9) | (v >> 23)) & MASK) ^ (((v << 17) | (v >> 15)) & MASK)
+        self.reg = [x ^ y for x, y in zip(self.reg, (a, b, c, d, e, f, g, h))]
+
+    def _fill(self):
+        a = 8 * self.size
+        self.chunk.append(128)
+        f = len(self.chunk) % 64
+        if 64 - f < 8:
+            f -= 64
+        while f < 56:
+            self.chunk.append(0)
+            f += 1
+        c = a // 4294967296
+        for i in range(4):
+            self.chunk.append((c >> 8 * (3 - i)) & 255)
+        for i in range(4):
+            self.chunk.append(((a & MASK) >> 8 * (3 - i)) & 255)
+
+
+try:
+    hashlib.new('sm3')
+    HASHLIB_SM3 = True
+except ValueError:
+    HASHLIB_SM3 = False
+
+
+def sm3_sum(e) -> list:
+    """
+    等价于new SM3().sum(e)；OpenSSL提供sm3时直接用hashlib，否则走纯Python实现
+    """
+    if not HASHLIB_SM3:
+        return SM3().sum(e)
+    data = e.encode('utf-8') if isinstance(e, str) else bytes(e)
+    return list(hashlib.new('sm3', data).digest())
+
+
+@functools.lru_cache(maxsize=16)
+def rc4_schedule(key: tuple) -> tuple:
+    """RC4密钥编排只与key有关，固定key(如"y")直接复用"""
+    s = list(range(256))
+    j = 0
+    for i in range(256):
+        j = (j + s[i] + key[i % len(key)]) % 256
+        s[i], s[j] = s[j], s[i]
+    return tuple(s)
+
+
+def rc4_encrypt(plaintext: list, key: list) -> list:
+    """参数和返回值均为码元列表"""
+    s = list(rc4_schedule(tuple(key)))
+    i = j = 0
+    cipher = []
+    for code in plaintext:
+        i = (i + 1) % 256
+        j = (j + s[i]) % 256
+        s[i], s[j] = s[j], s[i]
+        cipher.append(s[(s[i] + s[j]) % 256] ^ code)
+    return cipher
+
+
+def result_encrypt(long_str: list, num: str) -> str:
+    """码元列表按指定码表编码，越界字符按JS的NaN位运算视为0"""
+    table = ALPHABETS[num]
+    n = len(long_str)
+    codes = long_str + [0, 0]
+    result = []
+    for k in range((n * 4 + 2) // 3):
+        if k % 4 == 0:
+            r = k // 4 * 3
+            long_int = (codes[r] << 16) | (codes[r + 1] << 8) | codes[r + 2]
+            result.append(table[(long_int & 16515072) >> 18])
+        elif k % 4 == 1:
+            result.append(table[(long_int & 258048) >> 12])
+        elif k % 4 == 2:
+            result.append(table[(long_int & 4032) >> 6])
+        else:
+            result.append(table[long_int & 63])
+    return ''.join(result)
+
+
+def gener_random(rnd: float, option) -> list:
+    r = int(rnd)
+    return [
+        (r & 255 & 170) | option[0] & 85,
+        (r & 255 & 85) | option[0] & 170,
+        (r >> 8 & 255 & 170) | option[1] & 85,
+        (r >> 8 & 255 & 85) | option[1] & 170,
+    ]
+
+
+def generate_random_str(rand=random.random) -> list:
+    return (gener_random(rand() * 10000, [3, 45])
+            + gener_random(rand() * 10000, [1, 0])
+            + gener_random(rand() * 10000, [1, 5]))
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def ua_key(arguments) -> list:
+    # String.fromCharCode(0.00390625, 1, Arguments[2])，小数按ToUint16截断为0
+    return [0, 1, arguments[2] & 0xFFFF]
+
+
+def generate_rc4_bb_str(url_search_params: str, user_agent: str, window_env_str: str = WINDOW_ENV_STR,
+                        suffix: str = "cus", arguments=ARGUMENTS_DETAIL, now=now_ms) -> list:
+    context = get_sign_context(user_agent, tuple(arguments), window_env_str, suffix)
+    return context.rc4_bb(url_search_params, now)
+
+
+def build_bb(start_time: int, end_time: int, params_digest: list, cus: list, ua: list,
+             window_env_list: list, arguments) -> list:
+    """按JS中b[..]的下标组装待加密的码元列表"""
+    b = {8: 3, 18: 44}
+    b[20] = (start_time >> 24) & 255
+    b[21] = (start_time >> 16) & 255
+    b[22] = (start_time >> 8) & 255
+    b[23] = start_time & 255
+    b[24] = start_time // 4294967296
+    b[25] = start_time // 1099511627776
+
+    b[26] = (arguments[0] >> 24) & 255
+    b[27] = (arguments[0] >> 16) & 255
+    b[28] = (arguments[0] >> 8) & 255
+    b[29] = arguments[0] & 255
+
+    b[30] = (arguments[1] // 256) & 255
+    b[31] = (arguments[1] % 256) & 255
+    b[32] = (arguments[1] >> 24) & 255
+    b[33] = (arguments[1] >> 16) & 255
+
+    b[34] = (arguments[2] >> 24) & 255
+    b[35] = (arguments[2] >> 16) & 255
+    b[36] = (arguments[2] >> 8) & 255
+    b[37] = arguments[2] & 255
+
+    b[38] = params_digest[21]
+    b[39] = params_digest[22]
+    b[40] = cus[21]
+    b[41] = cus[22]
+    b[42] = ua[23]
+    b[43] = ua[24]
+
+    b[44] = (end_time >> 24) & 255
+    b[45] = (end_time >> 16) & 255
+    b[46] = (end_time >> 8) & 255
+    b[47] = end_time & 255
+    b[48] = b[8]
+    b[49] = end_time // 4294967296
+    b[50] = end_time // 1099511627776
+
+    b[52] = (PAGE_ID >> 24) & 255
+    b[53] = (PAGE_ID >> 16) & 255
+    b[54] = (PAGE_ID >> 8) & 255
+    b[55] = PAGE_ID & 255
+
+    b[57] = AID & 255
+    b[58] = (AID >> 8) & 255
+    b[59] = (AID >> 16) & 255
+    b[60] = (AID >> 24) & 255
+
+    b[64] = len(window_env_list)
+    b[65] = b[64] & 255
+    b[66] = (b[64] >> 8) & 255
+    b[69] = 0
+    b[70] = 0
+    b[71] = 0
+
+    b[72] = 0
+    for k in (18, 20, 26, 30, 38, 40, 42, 21, 27, 31, 35, 39, 41, 43, 22, 28, 32, 36, 23, 29, 33, 37,
+              44, 45, 46, 47, 48, 49, 50, 24, 25, 52, 53, 54, 55, 57, 58, 59, 60, 65, 66, 70, 71):
+        b[72] ^= b[k]
+
+    bb = [b[k] for k in (18, 20, 52, 26, 30, 34, 58, 38, 40, 53, 42, 21, 27, 54, 55, 31,
+                         35, 57, 39, 41, 43, 22, 28, 32, 60, 36, 23, 29, 33, 37, 44, 45,
+                         59, 46, 47, 48, 49, 50, 24, 25, 65, 66, 70, 71)]
+    bb = bb + list(window_env_list) + [b[72]]
+    return rc4_encrypt(bb, [121])
+
+
+class SignContext(object):
+    """
+    同一(UA, Arguments)下与查询串无关的中间结果：
+    后缀"cus"的两次SM3、UA经rc4/result_encrypt后的SM3、环境串码元
+    """
+
+    def __init__(self, user_agent: str, arguments=ARGUMENTS_DETAIL, window_env_str: str = WINDOW_ENV_STR,
+                 suffix: str = "cus"):
+        self.user_agent = user_agent
+        self.arguments = tuple(arguments)
+        self.suffix = suffix
+        self.cus = sm3_sum(sm3_sum(suffix))
+        self.ua = sm3_sum(result_encrypt(rc4_encrypt(to_codes(user_agent), ua_key(self.arguments)), "s3"))
+        self.window_env_list = to_codes(window_env_str)
+
+    def rc4_bb(self, url_search_params: str, now=now_ms) -> list:
+        start_time = now()
+        url_search_params_list = sm3_sum(sm3_sum(url_search_params + self.suffix))
+        end_time = now()
+        return build_bb(start_time, end_time, url_search_params_list, self.cus, self.ua,
+                        self.window_env_list, self.arguments)
+
+    def sign(self, url_search_params: str, now=now_ms, rand=random.random) -> str:
+        result = generate_random_str(rand) + self.rc4_bb(url_search_params, now)
+        return result_encrypt(result, "s4") + "="
+
+
+@functools.lru_cache(maxsize=64)
+def get_sign_context(user_agent: str, arguments=ARGUMENTS_DETAIL, window_env_str: str = WINDOW_ENV_STR,
+                     suffix: str = "cus") -> SignContext:
+    """按(UA, Arguments)缓存的签名上下文，同一UA的所有请求共享"""
+    return SignContext(user_agent, arguments, window_env_str, suffix)
+
+
+def sign(url_search_params: str, user_agent: str, arguments, now=now_ms, rand=random.random) -> str:
+    return get_sign_context(user_agent, tuple(arguments)).sign(url_search_params, now, rand)
+
+
+def sign_datail(params: str, user_agent: str, now=now_ms, rand=random.random) -> str:
+    return sign(params, user_agent, ARGUMENTS_DETAIL, now, rand)
+
+
+def sign_reply(params: str, user_agent: str, now=now_ms, rand=random.random) -> str:
+    return sign(params, user_agent, ARGUMENTS_REPLY, now, rand)
+
+
+class NativeSigner(object):
+    """
+    与douyin_signer中其他后端接口一致的纯Python签名器
+    """
+
+    CALLS = {
+        'sign_datail': sign_datail,
+        'sign_reply': sign_reply,
+    }
+
+    def call(self, name, *args):
+        return self.CALLS[name](*args)
+
+    def call_many(self, calls):
+        return [self.CALLS[c[0]](*c[1:]) for c in calls]
+
+    def close(self):
+        pass
+
+
+def random_query(rng: random.Random) -> str:
+    """生成一条随机查询串，包含已编码和未编码的非ASCII字符"""
+    keys = ['device_platform', 'aid', 'sec_user_id', 'max_cursor', 'msToken', 'webid', 'keyword', 'count']
+    parts = []
+    for key in rng.sample(keys, rng.randint(1, len(keys))):
+        value = ''.join(rng.choice('abcXYZ019-_.~%=/+ 抖音😀') for _ in range(rng.randint(0, 160)))
+        parts.append(f'{key}={value}')
+    return '&'.join(parts)
+
+
+def check_conformance(queries, user_agents, worker=None, seed=0) -> list:
+    """
+    固定时间和随机数后逐条对比JS与Python的签名结果，返回不一致的条目
+    """
+    from douyin_signer import NodeSigner
+    worker = worker or NodeSigner(workers=1).workers[0]
+    if not worker.alive():
+        worker.start()
+    rng = random.Random(seed)
+    mismatches = []
+    for i, query in enumerate(queries):
+        ua = user_agents[i % len(user_agents)]
+        name = 'sign_reply' if i % 2 else 'sign_datail'
+        start = rng.randint(1_600_000_000_000, 1_900_000_000_000)
+        times = [start, start + rng.randint(0, 5)]
+        rands = [rng.random() for _ in range(3)]
+        expected = worker.call(name, query, ua, now=times, random=rands)
+        actual = globals()[name](query, ua, now=iter(times).__next__, rand=iter(rands).__next__)
+        if actual != expected:
+            mismatches.append({'fn': name, 'query': query, 'ua': ua, 'now': times,
+                               'random': rands, 'js': expected, 'py': actual})
+    worker.stop()
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python douyin_abogus.py [条数] [查询串文件(每行一条)]
+    import sys
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'r', encoding='utf-8') as f:
+            queries = [line.rstrip('\n') for line in f if line.strip()][:count]
+    else:
+        rng = random.Random(count)
+        queries = [random_query(rng) for _ in range(count)]
+    uas = [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    ]
+    failed = check_conformance(queries, uas)
+    for item in failed[:5]:
+        print(item)
+    print(f'一致性校验: {len(queries) - len(failed)}/{len(queries)} 条与JS一致')
+    sys.exit(1 if failed else 0)
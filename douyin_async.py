@@ -0,0 +1,213 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_async.py
+@Desc    :   基于aiohttp的异步版Request，签名和参数构造复用douyin_request.Request
+'''
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from loguru import logger
+
+try:
+    import aiohttp
+    from multidict import CIMultiDict, CIMultiDictProxy
+    from yarl import URL
+except ImportError:
+    aiohttp = None
+
+try:
+    import douyin_cassette
+    import douyin_dns
+    import douyin_errors
+    import douyin_http
+    import douyin_metrics
+    import douyin_ratelimit
+    import douyin_singleflight
+    import douyin_webid
+    from douyin_cookies import cookies_dict_to_str
+    from douyin_request import Request
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_cassette
+    import douyin_dns
+    import douyin_errors
+    import douyin_http
+    import douyin_metrics
+    import douyin_ratelimit
+    import douyin_singleflight
+    import douyin_webid
+    from douyin_cookies import cookies_dict_to_str
+    from douyin_request import Request
+
+
+class AsyncRequest(object):
+    """
+    Request的异步版本：
+    - getJSON/getHTML/get_webid为协程，连接数由limit/limit_per_host限制
+    - 签名在线程池中执行，不阻塞事件循环
+    用法：
+        async with AsyncRequest(cookie) as r:
+            await asyncio.gather(*[r.getJSON(uri, params) for params in ...])
+    """
+
+    def __init__(self, cookie='', UA='', limit: int = 100, limit_per_host: int = 50,
+                 timeout: float = None, sign_workers: int = 4, request: Request = None):
+        if aiohttp is None:
+            raise ImportError('AsyncRequest需要aiohttp: pip install aiohttp')
+        # 参数模板、签名上下文等同步逻辑全部复用Request
+        self.request = request or Request(cookie, UA)
+        self.HOST = self.request.HOST
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        # 总时限，默认与同步版本一致(douyin_http.TOTAL_TIMEOUT)
+        self.timeout = timeout or douyin_http.TOTAL_TIMEOUT or None
+        self.executor = ThreadPoolExecutor(max_workers=sign_workers, thread_name_prefix='douyin-sign')
+        self.session = None
+        self.webid_lock = None
+        # Request的头部模板是只读的，Cookie头也只拼接一次；aiohttp不接受MappingProxyType，用只读的CIMultiDictProxy
+        cookie_header = cookies_dict_to_str(self.request.COOKIES)
+        self.headers = CIMultiDictProxy(CIMultiDict(self.request.HEADERS, Cookie=cookie_header))
+        self.page_headers = CIMultiDictProxy(CIMultiDict(self.request.PAGE_HEADERS, Cookie=cookie_header))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def get_session(self) -> 'aiohttp.ClientSession':
+        if self.session is None or self.session.closed:
+            # aiohttp自带的DNS缓存默认只保留10秒，与douyin_dns保持一致
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=int(douyin_dns.TTL))
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=douyin_http.CONNECT_TIMEOUT,
+                                              sock_read=douyin_http.READ_TIMEOUT),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.executor.shutdown(wait=False)
+
+    def get_headers(self, document: bool = False, **extra):
+        headers = self.page_headers if document else self.headers
+        return dict(headers, **extra) if extra else headers
+
+    async def getHTML(self, url) -> str:
+        headers = self.get_headers(document=True)
+        await douyin_ratelimit.acquire_async('douyin_page')
+        request_url, headers = douyin_http.redirect_host(url, headers)
+        async with self.get_session().get(request_url, headers=headers) as response:
+            text = await response.text()
+            if response.status != 200 or text == '':
+                logger.error(f'HTML请求失败, url: {url}, code: {response.status}')
+                return ''
+            return text
+
+    async def search_html(self, url, searcher) -> str:
+        """
+        分块读取页面交给searcher匹配，匹配到后立即断开连接
+        """
+        cassette = douyin_cassette.get_cassette()
+        if cassette.replaying:
+            replay = cassette.replay_http('GET', url)
+            return searcher.search([replay['body']]) if replay['status'] == 200 else ''
+        headers = self.get_headers(document=True)
+        await douyin_ratelimit.acquire_async('douyin_page')
+        start = time.perf_counter()
+        request_url, headers = douyin_http.redirect_host(url, headers)
+        async with self.get_session().get(request_url, headers=headers) as response:
+            if cassette.recording:
+                body = await response.read()
+                cassette.record_http('GET', url, None, response.status, response.headers, body, time.perf_counter() - start)
+                return searcher.search([body]) if response.status == 200 else ''
+            if response.status != 200:
+                logger.error(f'HTML请求失败, url: {url}, code: {response.status}')
+                return ''
+            async for chunk in response.content.iter_chunked(douyin_webid.CHUNK_SIZE):
+                result = searcher.feed(chunk)
+                if result:
+                    response.close()
+                    return result
+        return ''
+
+    async def get_webid(self):
+        if not self.request.WEBID:
+            if self.webid_lock is None:
+                self.webid_lock = asyncio.Lock()
+            # 并发请求只下载一次首页
+            async with self.webid_lock:
+                if not self.request.WEBID:
+                    key = self.request.get_webid_key()
+                    self.request.WEBID = douyin_webid.get_cache().get(key)
+                if not self.request.WEBID:
+                    self.request.WEBID = await self.search_html(douyin_webid.WEBID_URL, douyin_webid.StreamSearcher())
+                    if self.request.WEBID:
+                        douyin_webid.get_cache().set(key, self.request.WEBID)
+        return self.request.WEBID
+
+    async def fetch_json(self, uri: str, params: dict, data: dict = None) -> douyin_http.JSONResult:
+        """
+        单次请求，失败时抛出douyin_errors中对应的异常
+        """
+        # webid已缓存时构造参数不会再发起同步网络请求；异步获取失败时get_signed_url会退回同步的get_webid
+        # 两条路径上的网络错误都按传输错误处理，交给重试策略
+        loop = asyncio.get_running_loop()
+        try:
+            await self.get_webid()
+            url = await loop.run_in_executor(self.executor, self.request.get_signed_url, uri, params)
+        except (aiohttp.ClientError, asyncio.TimeoutError, requests.exceptions.RequestException) as e:
+            raise douyin_errors.TransportError(f'获取webid失败: {str(e) or e.__class__.__name__}',
+                                               url=f'{self.request.HOST}{uri}')
+        method = 'POST' if data else 'GET'
+        cassette = douyin_cassette.get_cassette()
+        # 回放模式下不经过限速器，离线回放不受线上接口配额限制
+        if not cassette.replaying:
+            await douyin_ratelimit.acquire_async('douyin_api')
+        start = time.perf_counter()
+        if cassette.replaying:
+            replay = cassette.replay_http(method, url, data)
+            status, headers, body = replay['status'], replay['headers'], replay['body']
+        else:
+            try:
+                request_url, headers = douyin_http.redirect_host(url, self.get_headers())
+                async with self.get_session().request(method, URL(request_url, encoded=True), data=data,
+                                                      headers=headers) as response:
+                    status, headers, body = response.status, response.headers, await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                douyin_ratelimit.feedback('douyin_api', False)
+                raise douyin_errors.TransportError(str(e) or e.__class__.__name__, url=url)
+            if cassette.recording:
+                cassette.record_http(method, url, data, status, headers, body, time.perf_counter() - start)
+        retry_after = douyin_ratelimit.parse_retry_after(headers.get('Retry-After'))
+        resp, error = douyin_http.decode_json(body, status, url, time.perf_counter() - start, retry_after)
+        if not cassette.replaying:
+            douyin_ratelimit.feedback('douyin_api', not (error and error.throttle), retry_after)
+        if error:
+            logger.error(f'JSON请求失败：url: {url}, code: {status}, {error}, body: {body[:500]}')
+            if isinstance(error, douyin_errors.EmptyResponse):
+                self.request.invalidate_webid()
+            raise error
+        douyin_metrics.observe(uri, resp.elapsed)
+        return resp
+
+    async def getJSON(self, uri: str, params: dict, data: dict = None,
+                      retry: douyin_errors.RetryPolicy = None) -> douyin_http.JSONResult:
+        """
+        与Request.getJSON一致：按重试策略重试，最终失败时返回带error的空JSONResult，相同请求并发时只发一次
+        """
+        async def call():
+            try:
+                return await (retry or self.request.RETRY).call_async(lambda: self.fetch_json(uri, params, data))
+            except douyin_errors.DouyinError as e:
+                return douyin_http.JSONResult(status=e.status, url=e.url, error=e)
+
+        key = douyin_singleflight.make_key(self.request.get_webid_key(), uri, params, data)
+        return await douyin_singleflight.group('getJSON').do_async(key, call)
@@ -0,0 +1,216 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_cassette.py
+@Desc    :   请求录制/回放：record模式把每次请求和响应追加到JSONL，replay模式按索引回放，不访问网络
+'''
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from loguru import logger
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import douyin_errors
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_errors
+
+# off / record / replay
+MODE = os.environ.get('DOUYIN_CASSETTE_MODE', 'off')
+# 仓库根目录的requests.jsonl另有用途，默认录制到config下
+CASSETTE_FILE = os.environ.get('DOUYIN_CASSETTE', 'config/cassette.jsonl')
+# 回放时按录制耗时的倍数等待，0为不等待，1为按原速复现
+REPLAY_LATENCY = float(os.environ.get('DOUYIN_CASSETTE_LATENCY', '0'))
+# 每次请求都会变化的参数不参与匹配，也不写入录制文件
+VOLATILE_PARAMS = ('a_bogus', 'msToken')
+# 只保存回放需要的响应头
+KEEP_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Location', 'Retry-After')
+
+
+class CassetteMiss(douyin_errors.TransportError):
+    """回放模式下没有对应的录制"""
+    retryable = False
+
+
+def strip_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in VOLATILE_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def request_key(method: str, url: str, data=None) -> str:
+    """
+    方法+去掉签名后按参数名排序的URL+请求体
+    """
+    parts = urlsplit(strip_url(url))
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    raw = f'{method.upper()} {parts.netloc}{parts.path}?{urlencode(query)}\n{json.dumps(data, sort_keys=True, default=str)}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def encode_body(body: bytes) -> dict:
+    try:
+        return {'body': body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'body': base64.b64encode(body).decode('ascii'), 'encoding': 'base64'}
+
+
+def decode_body(entry: dict) -> bytes:
+    if entry.get('encoding') == 'base64':
+        return base64.b64decode(entry['body'])
+    return entry.get('body', '').encode('utf-8')
+
+
+class Cassette(object):
+    """
+    每行一条记录；回放时同一请求按录制顺序依次返回，用完后重复最后一条
+    """
+
+    def __init__(self, path: str = CASSETTE_FILE, mode: str = MODE, latency: float = REPLAY_LATENCY):
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.index = None
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def append(self, entry: dict):
+        entry.setdefault('time', time.time())
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            path = os.path.dirname(self.path)
+            if path:
+                os.makedirs(path, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def load(self) -> dict:
+        with self.lock:
+            if self.index is None:
+                index = defaultdict(deque)
+                if os.path.exists(self.path):
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                index[entry['key']].append(entry)
+                self.index = index
+                logger.info(f'已加载录制 {sum(map(len, index.values()))} 条: {self.path}')
+            return self.index
+
+    def lookup(self, key: str, what: str = '') -> dict:
+        entries = self.load().get(key)
+        if not entries:
+            raise CassetteMiss(f'没有对应的录制: {what or key}')
+        with self.lock:
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        if self.latency and entry.get('elapsed'):
+            time.sleep(entry['elapsed'] * self.latency)
+        return entry
+
+    # HTTP请求
+
+    def record_http(self, method: str, url: str, data, status: int, headers, body: bytes, elapsed: float):
+        url = strip_url(url)
+        self.append({
+            'kind': 'http',
+            'key': request_key(method, url, data),
+            'method': method.upper(),
+            'url': url,
+            'params': dict(parse_qsl(urlsplit(url).query, keep_blank_values=True)),
+            'data': data,
+            'status': status,
+            'headers': {k: headers[k] for k in KEEP_HEADERS if k in headers},
+            'elapsed': round(elapsed, 4),
+            **encode_body(body),
+        })
+
+    def replay_http(self, method: str, url: str, data=None) -> dict:
+        """
+        返回{'status', 'headers', 'body'(bytes), 'elapsed'}
+        """
+        entry = self.lookup(request_key(method, url, data), f'{method.upper()} {strip_url(url)}')
+        return {
+            'status': entry['status'],
+            'headers': CaseInsensitiveDict(entry.get('headers', {})),
+            'body': decode_body(entry),
+            'elapsed': entry.get('elapsed', 0.0),
+        }
+
+    def send(self, send, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        douyin_http.request的录制/回放入口，send为实际发送请求的函数
+        """
+        data = kwargs.get('data')
+        if self.replaying:
+            return self.build_response(method, url, self.replay_http(method, url, data))
+        start = time.perf_counter()
+        response = send(method, url, **kwargs)
+        # 流式请求也读完整个body再录制，录制模式不追求速度
+        body = response.content
+        self.record_http(method, url, data, response.status_code, response.headers, body, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def build_response(method: str, url: str, replay: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = replay['status']
+        response.headers = replay['headers']
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = replay['body'] if method.upper() != 'HEAD' else b''
+        response._content_consumed = True
+        response.request = requests.Request(method, url).prepare()
+        return response
+
+    # 其他调用(Coze等)
+
+    def call(self, kind: str, key_data, func):
+        """
+        录制/回放任意返回值可JSON序列化的调用，key_data决定匹配哪条录制
+        """
+        if self.mode not in ('record', 'replay'):
+            return func()
+        key = hashlib.sha1(f'{kind}\n{json.dumps(key_data, sort_keys=True, default=str)}'.encode('utf-8')).hexdigest()
+        if self.replaying:
+            return self.lookup(key, kind)['result']
+        start = time.perf_counter()
+        result = func()
+        self.append({'kind': kind, 'key': key, 'request': key_data, 'result': result,
+                     'elapsed': round(time.perf_counter() - start, 4)})
+        return result
+
+
+_cassette = None
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette()
+    return _cassette
+
+
+def configure(mode: str, path: str = None, latency: float = None) -> Cassette:
+    """
+    切换录制/回放模式，例如 configure('replay', 'config/cassette.jsonl')
+    """
+    global _cassette
+    if mode not in ('off', 'record', 'replay'):
+        raise ValueError(f'未知的录制模式: {mode}, 可选: off, record, replay')
+    _cassette = Cassette(path or CASSETTE_FILE, mode, REPLAY_LATENCY if latency is None else latency)
+    return _cassette
@@ -0,0 +1,113 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_clients.py
+@Desc    :   进程内共享的客户端(DouyinUserInfo等)注册表，按cookie指纹复用，保留webid和连接状态
+'''
+import threading
+from collections import OrderedDict
+
+from loguru import logger
+
+try:
+    import douyin_webid
+    from douyin_cookies import cookies_str_to_dict
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_webid
+    from douyin_cookies import cookies_str_to_dict
+
+
+class ClientRegistry(object):
+    """
+    factory(cookie)构造客户端；同一账号(身份cookie相同)共用一个实例，
+    同一账号的cookie字符串变化(例如重新配置了cookie)时旧实例失效并重建
+    超过max_size个账号时淘汰最久未使用的
+    """
+
+    def __init__(self, factory, max_size: int = 16):
+        self.factory = factory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.clients = OrderedDict()  # 指纹 -> (cookie, client)
+        self.keys = {}  # cookie字符串 -> 指纹，避免每次都重新解析cookie
+        self.created = 0
+        self.hits = 0
+
+    def key(self, cookie: str) -> str:
+        key = self.keys.get(cookie)
+        if key is None:
+            # 只解析字符串，不写config/cookie.json，也不读取浏览器；'chrome'等浏览器名直接作为key
+            if '=' in cookie:
+                key = douyin_webid.cookie_fingerprint(cookies_str_to_dict(cookie))
+            else:
+                key = f'browser:{cookie}'
+            if len(self.keys) >= self.max_size * 4:
+                self.keys.clear()
+            self.keys[cookie] = key
+        return key
+
+    def get(self, cookie: str):
+        key = self.key(cookie)
+        with self.lock:
+            entry = self.clients.get(key)
+            if entry is not None and entry[0] == cookie:
+                self.clients.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                logger.info(f'cookie已变化，重建客户端: {key}')
+            client = self.factory(cookie)
+            self.clients[key] = (cookie, client)
+            self.clients.move_to_end(key)
+            self.created += 1
+            while len(self.clients) > self.max_size:
+                self.clients.popitem(last=False)
+            return client
+
+    def invalidate(self, cookie: str = None):
+        """
+        丢弃指定cookie对应的客户端，不传时清空全部
+        """
+        with self.lock:
+            if cookie is None:
+                self.clients.clear()
+            else:
+                self.clients.pop(self.key(cookie), None)
+
+    def stats(self) -> dict:
+        return {'clients': len(self.clients), 'created': self.created, 'hits': self.hits}
+
+
+_registries = {}
+_lock = threading.Lock()
+
+
+def get_registry(factory=None) -> ClientRegistry:
+    """
+    每个factory一个注册表，不传时为douyin_get_user_info.DouyinUserInfo
+    """
+    if factory is None:
+        try:
+            from douyin_get_user_info import DouyinUserInfo
+        except ImportError:
+            # 处理直接运行时的导入
+            from douyin_get_user_info import DouyinUserInfo
+        factory = DouyinUserInfo
+    with _lock:
+        if factory not in _registries:
+            _registries[factory] = ClientRegistry(factory)
+        return _registries[factory]
+
+
+def get_client(cookie: str, factory=None):
+    return get_registry(factory).get(cookie)
+
+
+def invalidate(cookie: str = None):
+    """
+    cookie失效或被替换时调用，所有注册表中对应的客户端都会被丢弃
+    """
+    with _lock:
+        registries = list(_registries.values())
+    for registry in registries:
+        registry.invalidate(cookie)
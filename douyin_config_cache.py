@@ -0,0 +1,219 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_config_cache.py
+@Desc    :   配置文件的进程内缓存：解析一次，文件的mtime/inode/大小变化时才重新读取
+             长时间运行的进程可启动inotify监听(需要inotify_simple，仅Linux)，省去每次读取前的stat
+'''
+import os
+import threading
+
+import ujson as json
+from loguru import logger
+
+try:
+    import douyin_cookie_store
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_cookie_store
+
+# 设为1时在第一次读取配置时自动启动监听
+WATCH = os.environ.get('DOUYIN_CONFIG_WATCH', '0') == '1'
+
+
+def _signature(path: str):
+    """
+    文件不存在时为None，否则为(设备, inode, 修改时间ns, 大小)；原子替换写入会改变inode
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class ConfigCache(object):
+    """
+    load(key, paths, loader)：paths中任一文件变化(包括创建、删除)时重新调用loader，否则返回上次的结果
+    loader抛出的异常不缓存
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> (paths, 签名, 结果)
+        self.dirty = set()  # 监听到变化、尚未重新读取的key
+        self.pending = {}  # 正在读取的key -> paths，读取期间的变化同样要标记
+        self.watcher = None
+        self.hits = 0
+        self.loads = 0
+
+    def load(self, key, paths, loader):
+        paths = tuple(os.path.abspath(path) for path in paths)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == paths and self.watching and key not in self.dirty:
+            self.hits += 1
+            return entry[2]
+        # 先清除标记、加上监听再取签名和读取，读取期间发生的变化会重新标记，不会被之后的写入覆盖
+        with self.lock:
+            self.dirty.discard(key)
+            self.pending[key] = paths
+        try:
+            if self.watcher is not None:
+                self.watcher.watch(paths)
+            signature = tuple(_signature(path) for path in paths)
+            if entry is not None and entry[0] == paths and entry[1] == signature:
+                self.hits += 1
+                return entry[2]
+            result = loader()
+            with self.lock:
+                self.loads += 1
+                self.entries[key] = (paths, signature, result)
+            return result
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    @property
+    def watching(self) -> bool:
+        return self.watcher is not None and self.watcher.alive
+
+    def changed(self, path: str):
+        """
+        监听线程回调：标记依赖该文件的缓存需要重新读取
+        """
+        with self.lock:
+            for key, (paths, _, _) in self.entries.items():
+                if path in paths:
+                    self.dirty.add(key)
+            for key, paths in self.pending.items():
+                if path in paths:
+                    self.dirty.add(key)
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'hits': self.hits, 'loads': self.loads, 'watching': self.watching}
+
+
+class InotifyWatcher(object):
+    """
+    监听缓存文件所在目录的写入、替换和删除事件
+    """
+
+    def __init__(self, cache: ConfigCache):
+        from inotify_simple import INotify, flags
+        self.cache = cache
+        self.inotify = INotify()
+        self.mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.CREATE | flags.DELETE | flags.ATTRIB
+        self.dirs = {}  # 监听描述符 -> 目录
+        self.lock = threading.Lock()
+        self.alive = True
+        self.thread = threading.Thread(target=self.run, name='config-watcher', daemon=True)
+        self.thread.start()
+
+    def watch(self, paths):
+        with self.lock:
+            for directory in {os.path.dirname(path) for path in paths}:
+                if directory in self.dirs.values() or not os.path.isdir(directory):
+                    continue
+                self.dirs[self.inotify.add_watch(directory, self.mask)] = directory
+
+    def run(self):
+        try:
+            while True:
+                for event in self.inotify.read():
+                    directory = self.dirs.get(event.wd)
+                    if directory is not None and event.name:
+                        self.cache.changed(os.path.join(directory, event.name))
+        except Exception as e:
+            # 监听失效后退回到每次读取前检查文件签名
+            logger.warning(f'配置文件监听已停止: {e}')
+        finally:
+            self.alive = False
+
+
+_cache = ConfigCache()
+
+
+def get_cache() -> ConfigCache:
+    return _cache
+
+
+def start_watcher() -> bool:
+    """
+    启动inotify监听，inotify_simple未安装或系统不支持时返回False(缓存仍按文件签名判断变化)
+    """
+    with _cache.lock:
+        if _cache.watching:
+            return True
+        try:
+            _cache.watcher = InotifyWatcher(_cache)
+        except (ImportError, OSError) as e:
+            logger.info(f'未启用配置文件监听: {e}')
+            _cache.watcher = None
+            return False
+        paths = [path for paths, _, _ in _cache.entries.values() for path in paths]
+        # 启动前读取的缓存无法确认是否已变化，下次读取时先检查一次签名
+        _cache.dirty.update(_cache.entries)
+    _cache.watcher.watch(paths)
+    return True
+
+
+def load(key, paths, loader):
+    if WATCH and _cache.watcher is None:
+        start_watcher()
+    return _cache.load(key, paths, loader)
+
+
+def read_text(path: str) -> str:
+    """
+    文件内容，文件不存在时为None
+    """
+    def loader():
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    return load(('text', os.path.abspath(path)), (path,), loader)
+
+
+def read_json(path: str):
+    """
+    解析后的JSON，文件不存在时为None；返回的对象是共享的，调用方不要修改
+    """
+    def loader():
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return load(('json', os.path.abspath(path)), (path,), loader)
+
+
+def read_cookie_config(path: str) -> dict:
+    """
+    文本格式的cookie配置，返回{'cookie', 'browser'}，文件不存在时为None
+    """
+    def loader():
+        content = read_text(path)
+        return None if content is None else douyin_cookie_store.parse_text(content)
+    return load(('cookie_config', os.path.abspath(path)), (path,), loader)
+
+
+def read_cookie_store(store=None) -> dict:
+    """
+    cookie存储的当前文档，存储文件和文本配置任一变化时重新读取；返回的文档是共享的，调用方不要修改
+    """
+    store = store or douyin_cookie_store.get_store()
+    paths = (store.path,) + ((store.legacy_text,) if store.legacy_text else ())
+    return load(('cookie_store', os.path.abspath(store.path)), paths, store.load)
+
+
+def get_config_cookie(store=None) -> str:
+    """
+    配置的cookie字符串，没有配置时为空字符串
+    """
+    return read_cookie_store(store)['cookie']
@@ -0,0 +1,217 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_cookie_store.py
+@Desc    :   结构化的cookie存储：单个JSON文件，原子替换写入，备份保存在有上限的历史记录中
+             config/cookie_config.txt只作为导入/导出格式
+'''
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from loguru import logger
+
+STORE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'cookie_store.json')
+# 最多保留几份历史cookie
+HISTORY_SIZE = int(os.environ.get('DOUYIN_COOKIE_HISTORY', '10'))
+# 更新cookie时是否同时导出文本配置文件，供仍读取文本格式的脚本使用
+EXPORT_TEXT = os.environ.get('DOUYIN_COOKIE_TEXT_EXPORT', '1') != '0'
+VERSION = 1
+
+TEXT_TEMPLATE = """# 抖音Cookie配置文件
+# 使用说明：
+# 1. 将您的完整cookie字符串粘贴到下面的cookie行
+# 2. 或者设置浏览器自动获取方式：chrome 或 edge
+# 3. 以 # 开头的行为注释行，会被忽略
+
+# 方式1：直接填写cookie字符串（推荐）
+# 请将完整的cookie字符串粘贴到下面（去掉前面的#号）：
+{cookie_line}
+
+# 方式2：自动从浏览器获取（备用）
+# 支持 chrome 或 edge
+browser={browser}
+{updated_line}
+# 注意事项：
+# - Cookie有效期较短，通常几小时到几天
+# - 如果获取失败，请重新登录抖音网页版获取新的cookie
+# - 建议定期更新cookie以保持有效性
+"""
+
+
+def parse_text(content: str) -> dict:
+    """
+    解析文本配置，返回{'cookie': str, 'browser': str}，注释掉的cookie行忽略
+    """
+    result = {'cookie': '', 'browser': ''}
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith('cookie='):
+            value = line[len('cookie='):].strip()
+            if value and value != 'your_cookie_string_here':
+                result['cookie'] = value
+        elif line.startswith('browser='):
+            result['browser'] = line[len('browser='):].strip()
+    return result
+
+
+def render_text(cookie: str = '', browser: str = 'chrome', updated_at: str = '') -> str:
+    """
+    生成文本配置，只保留一行最后更新时间
+    """
+    return TEXT_TEMPLATE.format(
+        cookie_line=f'cookie={cookie}' if cookie else '#cookie=your_cookie_string_here',
+        browser=browser or 'chrome',
+        updated_line=f'# 最后更新时间：{updated_at}\n' if updated_at else '',
+    )
+
+
+def atomic_write(path: str, content: str):
+    """
+    先写同目录下的临时文件再os.replace，读者只会看到完整的旧文件或新文件
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _empty() -> dict:
+    return {'version': VERSION, 'cookie': '', 'browser': '', 'updated_at': '', 'expires': {}, 'meta': {}, 'history': []}
+
+
+class CookieStore(object):
+    """
+    文档结构：{'version', 'cookie', 'browser', 'updated_at', 'expires', 'meta', 'history'}
+    expires为各cookie字段的过期时间(unix秒)，history按时间倒序保存被替换的cookie，最多history_size份
+    存储文件不存在时从legacy_text(旧的文本配置)导入
+    """
+
+    def __init__(self, path: str = STORE_FILE, history_size: int = HISTORY_SIZE, legacy_text: str = None):
+        self.path = path
+        self.history_size = history_size
+        self.legacy_text = legacy_text
+        self.lock = threading.Lock()
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                doc = dict(_empty(), **json.load(f))
+        except FileNotFoundError:
+            return self.import_text(self.legacy_text) if self.legacy_text else _empty()
+        except (OSError, ValueError) as e:
+            logger.warning(f'读取cookie存储失败，按空存储处理: {self.path}: {e}')
+            return _empty()
+        return self.merge_text(doc)
+
+    def merge_text(self, doc: dict) -> dict:
+        """
+        文本配置比存储文件新且cookie不同时(用户手动粘贴了cookie)，以文本中的cookie为准
+        """
+        if not self.legacy_text:
+            return doc
+        try:
+            newer = os.path.getmtime(self.legacy_text) > os.path.getmtime(self.path)
+        except OSError:
+            return doc
+        if not newer:
+            return doc
+        text = self.import_text(self.legacy_text)
+        if text['cookie'] and text['cookie'] != doc['cookie']:
+            self.archive(doc)
+            doc.update({key: text[key] for key in ('cookie', 'browser', 'updated_at', 'meta')}, expires={})
+        return doc
+
+    def archive(self, doc: dict):
+        """
+        把当前cookie放到历史记录最前面，超出上限的最旧记录被丢弃
+        """
+        if doc['cookie']:
+            entry = {key: doc[key] for key in ('cookie', 'browser', 'updated_at', 'expires')}
+            doc['history'] = ([entry] + doc['history'])[:self.history_size]
+
+    def save(self, doc: dict):
+        atomic_write(self.path, json.dumps(doc, ensure_ascii=False, indent=2))
+
+    def update(self, cookie: str, browser: str = '', expires: dict = None, **meta) -> dict:
+        """
+        写入新cookie，被替换的cookie进入历史记录；meta为来源等附加信息(例如user_url)
+        """
+        with self.lock:
+            doc = self.load()
+            if doc['cookie'] != cookie:
+                self.archive(doc)
+            doc.update(
+                cookie=cookie,
+                browser=browser or doc['browser'],
+                updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                expires=dict(expires or {}),
+                meta=meta,
+            )
+            self.save(doc)
+            return doc
+
+    def restore(self, index: int = 0) -> dict:
+        """
+        用第index份历史cookie(0为最近一份)替换当前cookie
+        """
+        with self.lock:
+            doc = self.load()
+            entry = doc['history'].pop(index)
+            self.archive(doc)
+            doc.update(entry)
+            self.save(doc)
+            return doc
+
+    def get_cookie(self) -> str:
+        return self.load()['cookie']
+
+    def import_text(self, path: str) -> dict:
+        """
+        从文本配置导入(不写入存储文件，下一次update时落盘)
+        """
+        doc = _empty()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            return doc
+        doc.update(parse_text(content))
+        if doc['cookie']:
+            doc['updated_at'] = datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S')
+            doc['meta'] = {'imported_from': path}
+        return doc
+
+    def export_text(self, path: str, doc: dict = None):
+        """
+        按当前cookie重新生成文本配置(覆盖原文件)
+        """
+        doc = doc or self.load()
+        atomic_write(path, render_text(doc['cookie'], doc['browser'], doc['updated_at']))
+
+
+_store = None
+_lock = threading.Lock()
+
+
+def get_store() -> CookieStore:
+    """
+    默认位置的存储，首次使用时从config/cookie_config.txt导入
+    """
+    global _store
+    with _lock:
+        if _store is None:
+            _store = CookieStore(legacy_text=os.path.join(os.path.dirname(STORE_FILE), 'cookie_config.txt'))
+        return _store
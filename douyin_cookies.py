@@ -1,14 +1,15 @@
 import os
+from functools import lru_cache
 
 import rookiepy
-import requests
-import ujson as json
 from loguru import logger
 
 try:
+    import douyin_config_cache
     from douyin_util import save_json
 except ImportError:
     # 处理直接运行时的导入
+    import douyin_config_cache
     from douyin_util import save_json
 
 
@@ -23,13 +24,13 @@ def get_cookie_dict(cookie='') -> dict:
             cookie = get_browser_cookie(cookie)
         else:
             cookie = cookies_str_to_dict(cookie)
-        save_cookie(cookie)
+        # 与已保存的相同时不再重写文件
+        if douyin_config_cache.read_json('config/cookie.json') != cookie:
+            save_cookie(cookie)
     elif os.path.exists('config/cookie.txt'):
-        with open('config/cookie.txt', 'r', encoding='utf-8') as f:
-            cookie = cookies_str_to_dict(f.read())
+        cookie = cookies_str_to_dict(douyin_config_cache.read_text('config/cookie.txt'))
     elif os.path.exists('config/cookie.json'):
-        with open('config/cookie.json', 'r', encoding='utf-8') as f:
-            cookie = json.load(f)
+        cookie = dict(douyin_config_cache.read_json('config/cookie.json'))
     else:
         cookie = cookies_str_to_dict(input('请输入cookie:'))
         save_cookie(cookie)
@@ -40,15 +41,15 @@ def save_cookie(cookie: dict):
     save_json('config/cookie', cookie)
 
 
-def test_cookie(cookie):
-    url = 'https://sso.douyin.com/check_login/'
+def test_cookie(cookie, force=False):
+    # 结果按TTL缓存，见douyin_login；在函数内导入避免循环导入
+    import douyin_login
     if type(cookie) is dict:
         cookie_dict = cookie
     elif type(cookie) is str:
         cookie_dict = cookies_str_to_dict(cookie)
 
-    res = requests.get(url, cookies=cookie_dict).json()
-    if res['has_login'] is True:
+    if douyin_login.get_cache().is_valid(cookie_dict, force=force):
         logger.success('cookie已登录')
         return True
     else:
@@ -57,14 +58,20 @@ def test_cookie(cookie):
 
 
 def cookies_str_to_dict(cookie_string: str) -> dict:
+    # 同一个cookie字符串会被反复解析，结果缓存，每次返回新的dict
+    return dict(_parse_cookie_str(cookie_string))
+
+
+@lru_cache(maxsize=32)
+def _parse_cookie_str(cookie_string: str) -> tuple:
     cookies = cookie_string.strip().split('; ')
-    cookie_dict = {}
+    cookie_items = []
     for cookie in cookies:
         if cookie == '' or cookie == 'douyin.com':
             continue
         key, value = cookie.split('=', 1)
-        cookie_dict[key] = value
-    return cookie_dict
+        cookie_items.append((key, value))
+    return tuple(cookie_items)
 
 
 def cookies_dict_to_str(cookie_string: dict) -> str:
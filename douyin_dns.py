@@ -0,0 +1,156 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_dns.py
+@Desc    :   进程内DNS缓存(带TTL)和启动预热：并行解析并预先建立到常用域名的连接
+'''
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+try:
+    import douyin_http
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_http
+
+TTL = float(os.environ.get('DOUYIN_DNS_TTL', '300'))
+# 是否启用DNS缓存，与预热分开控制
+CACHE = os.environ.get('DOUYIN_DNS_CACHE', '1') != '0'
+# 爬虫每次运行都会访问的域名(首页/接口、登录检查)，短链接等其他域名由url_hosts从待处理链接中取得
+WARM_HOSTS = (
+    'www.douyin.com',
+    'sso.douyin.com',
+)
+# 是否在爬虫启动时预热，设为0可对比预热前后的首个结果耗时(不影响DNS缓存)
+WARMUP = os.environ.get('DOUYIN_WARMUP', '1') != '0'
+
+
+class DNSCache(object):
+    """
+    包装socket.getaddrinfo，成功的解析结果缓存TTL秒，解析失败不缓存
+    """
+
+    def __init__(self, ttl: float = TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.getaddrinfo = socket.getaddrinfo
+
+    def resolve(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        result = self.getaddrinfo(host, port, family, type, proto, flags)
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = (now + self.ttl, result)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def install(ttl: float = TTL) -> DNSCache:
+    """
+    用缓存替换socket.getaddrinfo(requests和aiohttp的默认解析器都经过它)，重复调用只安装一次
+    """
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = DNSCache(ttl)
+            socket.getaddrinfo = _cache.resolve
+        return _cache
+
+
+def uninstall():
+    global _cache
+    with _lock:
+        if _cache is not None:
+            socket.getaddrinfo = _cache.getaddrinfo
+            _cache = None
+
+
+def get_cache() -> DNSCache:
+    return _cache
+
+
+def url_hosts(urls) -> tuple:
+    """
+    待处理链接中出现的域名(例如短链接的v.douyin.com)，按首次出现的顺序去重
+    """
+    hosts = []
+    for url in urls:
+        host = urlsplit(url).hostname
+        if host and host not in hosts:
+            hosts.append(host)
+    return tuple(hosts)
+
+
+def preconnect(host: str, scheme: str = 'https'):
+    """
+    解析域名并通过douyin_http的共享Session发一个HEAD请求，请求结束后连接留在连接池中复用
+    返回(解析耗时, 请求耗时)；设置了douyin_http.HOST_OVERRIDE时连接的是改写后的地址
+    """
+    url, headers = douyin_http.redirect_host(f'{scheme}://{host}/', {})
+    parts = urlsplit(url)
+    start = time.perf_counter()
+    socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), 0, socket.SOCK_STREAM)
+    resolved = time.perf_counter()
+    # 直接使用Session而不是douyin_http.head，预热请求不进入录制/回放
+    douyin_http.get_session().head(url, headers=headers, timeout=douyin_http.TIMEOUT, allow_redirects=False).close()
+    return resolved - start, time.perf_counter() - resolved
+
+
+def resolve(host: str, port: int = 443) -> float:
+    """
+    只解析域名(写入DNS缓存)，用于不经过douyin_http连接池的客户端，例如Coze SDK
+    """
+    start = time.perf_counter()
+    socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    return time.perf_counter() - start
+
+
+def warmup(hosts=WARM_HOSTS, resolve_hosts=(), workers: int = 8) -> dict:
+    """
+    并行预热：hosts解析并预连接，resolve_hosts只解析；DNS缓存由调用方按CACHE另行install
+    返回{host: {'dns': 秒, 'head': 秒} 或 {'error': 信息}}，失败不影响后续请求
+    """
+    start = time.perf_counter()
+    results = {}
+
+    def run(host, connect):
+        try:
+            if connect:
+                dns, seconds = preconnect(host)
+                results[host] = {'dns': round(dns, 4), 'head': round(seconds, 4)}
+            else:
+                results[host] = {'dns': round(resolve(host), 4)}
+        except Exception as e:
+            results[host] = {'error': str(e) or e.__class__.__name__}
+
+    jobs = [(host, True) for host in hosts] + [(host, False) for host in resolve_hosts]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmup') as executor:
+        list(executor.map(lambda job: run(*job), jobs))
+    hosts = [host for host, _ in jobs]
+    failed = [host for host, result in results.items() if 'error' in result]
+    logger.info(f'预热 {len(hosts)} 个域名完成，耗时 {time.perf_counter() - start:.3f}s'
+                + (f'，失败: {", ".join(failed)}' if failed else ''))
+    return results
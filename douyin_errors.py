@@ -0,0 +1,147 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_errors.py
+@Desc    :   请求错误分类与重试策略：只重试临时性错误，永久性错误立即返回
+'''
+import asyncio
+import random
+import time
+
+from loguru import logger
+
+
+class DouyinError(Exception):
+    """
+    请求失败的基类，保留原始状态码、body和url
+    retryable表示是否值得重试，throttle表示是否应让限速器退避
+    """
+    retryable = False
+    throttle = True
+
+    def __init__(self, message: str = '', status: int = 0, body: bytes = b'', url: str = '', retry_after: float = 0.0):
+        super().__init__(message or self.__class__.__doc__.strip())
+        self.status = status
+        self.body = body
+        self.url = url
+        self.retry_after = retry_after
+
+
+class TransportError(DouyinError):
+    """连接失败或超时"""
+    retryable = True
+
+
+class HTTPStatusError(DouyinError):
+    """HTTP状态码非200"""
+
+
+class RateLimited(HTTPStatusError):
+    """请求过于频繁(429)"""
+    retryable = True
+
+
+class ServerError(HTTPStatusError):
+    """服务端错误(5xx)"""
+    retryable = True
+
+
+class ClientError(HTTPStatusError):
+    """请求被拒绝(4xx)"""
+    throttle = False
+
+
+class EmptyResponse(DouyinError):
+    """200但响应为空，通常是签名或参数校验未通过"""
+    retryable = True
+
+
+class DecodeError(DouyinError):
+    """响应不是合法的JSON对象，通常是验证码或登录页"""
+    throttle = False
+
+
+class APIError(DouyinError):
+    """接口返回的status_code非0"""
+
+    def __init__(self, message: str = '', status_code: int = 0, **kwargs):
+        super().__init__(message, **kwargs)
+        self.status_code = status_code
+
+
+# 接口返回这些status_code表示cookie已失效(8: 用户未登录)
+AUTH_STATUS_CODES = (8,)
+
+
+def is_auth_error(error) -> bool:
+    """
+    是否因cookie失效而失败：HTTP 401/403，或接口返回未登录
+    """
+    if isinstance(error, ClientError):
+        return error.status in (401, 403)
+    if isinstance(error, APIError):
+        return error.status_code in AUTH_STATUS_CODES
+    return False
+
+
+def http_error(status: int, **kwargs) -> HTTPStatusError:
+    if status == 429:
+        return RateLimited(f'HTTP {status}', status=status, **kwargs)
+    if status >= 500:
+        return ServerError(f'HTTP {status}', status=status, **kwargs)
+    return ClientError(f'HTTP {status}', status=status, **kwargs)
+
+
+class RetryPolicy(object):
+    """
+    指数退避+全抖动：第n次重试前等待 random(0, min(max_delay, base * factor ** n)) 秒，
+    服务端给出Retry-After时以其为下限；超过max_attempts次或累计max_elapsed秒后放弃
+    """
+
+    def __init__(self, max_attempts: int = 4, base: float = 0.5, factor: float = 2.0,
+                 max_delay: float = 10.0, max_elapsed: float = 30.0):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+
+    def delay(self, attempt: int, error: DouyinError) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base * self.factor ** attempt))
+        return max(backoff, error.retry_after)
+
+    def next_delay(self, attempt: int, error: DouyinError, start: float):
+        """
+        返回下次重试前的等待秒数，不应再重试时返回None
+        """
+        if not error.retryable or attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.delay(attempt, error)
+        if time.monotonic() - start + delay > self.max_elapsed:
+            return None
+        logger.warning(f'请求失败({error.__class__.__name__}: {error}), {delay:.2f} 秒后第{attempt + 1}次重试')
+        return delay
+
+    def call(self, func):
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            try:
+                return func()
+            except DouyinError as e:
+                delay = self.next_delay(attempt, e, start)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def call_async(self, func):
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            try:
+                return await func()
+            except DouyinError as e:
+                delay = self.next_delay(attempt, e, start)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
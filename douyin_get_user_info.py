@@ -9,9 +9,16 @@ import os
 import re
 import sys
 import json
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import urlparse, unquote
 
 # 导入本地模块
+import douyin_async
+import douyin_config_cache
+import douyin_cookie_store
+import douyin_metrics
 import douyin_request as request
 import douyin_cookies as cookies  
 import douyin_util as util
@@ -21,12 +28,38 @@ get_cookie_dict = cookies.get_cookie_dict
 str_to_path = util.str_to_path
 url_redirect = util.url_redirect
 
+# 对冲请求的线程池，多个DouyinUserInfo共用
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+
+def get_hedge_executor():
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='profile-hedge')
+    return _hedge_executor
+
 
 class DouyinUserInfo:
+    # 主接口和备用接口：(uri, 响应中用户信息的键)
+    PROFILE_ENDPOINTS = (
+        ('/aweme/v1/web/user/profile/other/', 'user'),
+        ('/web/api/v2/user/info/', 'user_info'),
+    )
+    # 对冲模式：主接口超过其p95耗时仍未返回时，并行请求备用接口，先拿到可用结果的一方胜出
+    HEDGE = os.environ.get('DOUYIN_HEDGE_PROFILE', '0') == '1'
+    HEDGE_QUANTILE = 0.95
+    HEDGE_MIN_SAMPLES = 20  # 样本不足时使用默认等待时间
+    HEDGE_DEFAULT_DELAY = 1.0
+    HEDGE_MIN_DELAY = 0.05
+
     def __init__(self, cookie=''):
         """初始化用户信息获取器"""
         self.request = Request(cookie)
         self.user_info = {}
+        # 最近一次获取失败的原因(douyin_errors中的异常)，用于判断是否是cookie失效
+        self.last_error = None
         
     def extract_user_id_from_url(self, url):
         """从抖音链接中提取用户ID"""
@@ -48,9 +81,107 @@ class DouyinUserInfo:
             print(f"❌ URL解析失败: {e}")
             return None
     
-    def get_user_profile(self, sec_user_id):
-        """获取用户详细信息"""
+    def _profile_params(self, index, sec_user_id):
+        """主接口/备用接口的请求参数"""
+        if index == 0:
+            return {
+                "publish_video_strategy_type": 2,
+                "sec_user_id": sec_user_id, 
+                "personal_center_strategy": 1
+            }
+        return {"sec_uid": sec_user_id}
+    
+    def _fetch_profile(self, index, sec_user_id):
+        """请求单个接口，返回用户数据，失败返回None"""
+        uri, key = self.PROFILE_ENDPOINTS[index]
+        resp = self.request.getJSON(uri, self._profile_params(index, sec_user_id))
+        return self._profile_data(resp, key)
+    
+    async def _fetch_profile_async(self, client, index, sec_user_id):
+        uri, key = self.PROFILE_ENDPOINTS[index]
+        resp = await client.getJSON(uri, self._profile_params(index, sec_user_id))
+        return self._profile_data(resp, key)
+    
+    def _profile_data(self, resp, key):
+        """取出用户数据，失败时记下resp.error"""
+        if resp and key in resp:
+            return resp[key]
+        if getattr(resp, 'error', None) is not None:
+            self.last_error = resp.error
+        return None
+    
+    def hedge_delay(self):
+        """主接口成功请求耗时的p95，样本不足时使用默认值"""
+        histogram = douyin_metrics.histogram(self.PROFILE_ENDPOINTS[0][0])
+        if histogram.count < self.HEDGE_MIN_SAMPLES:
+            return self.HEDGE_DEFAULT_DELAY
+        return max(self.HEDGE_MIN_DELAY, histogram.percentile(self.HEDGE_QUANTILE))
+    
+    def _get_user_profile_hedged(self, sec_user_id):
+        """
+        对冲请求：主接口在hedge_delay()内未返回(或已失败)时并行请求备用接口
+        requests的请求无法中途打断，落败一方尚未开始时取消，已在请求中则丢弃其结果
+        """
+        executor = get_hedge_executor()
+        delay = self.hedge_delay()
+        pending = {executor.submit(self._fetch_profile, 0, sec_user_id)}
+        hedged = False
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged else delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                user_data = future.result()
+                if user_data:
+                    for other in pending:
+                        other.cancel()
+                    return self._extract_user_info(user_data)
+            if not hedged:
+                hedged = True
+                if done:
+                    print("🔄 尝试备用API...")
+                else:
+                    print(f"⏱️ 主接口 {delay:.2f} 秒未返回，并行请求备用API...")
+                pending.add(executor.submit(self._fetch_profile, 1, sec_user_id))
+        print("❌ 无法获取用户信息，可能是cookie无效或用户不存在")
+        return None
+    
+    async def _get_user_profile_hedged_async(self, client, sec_user_id):
+        """异步对冲请求，落败一方的任务直接取消"""
+        delay = self.hedge_delay()
+        pending = {asyncio.ensure_future(self._fetch_profile_async(client, 0, sec_user_id))}
+        hedged = False
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=None if hedged else delay,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    user_data = task.result()
+                    if user_data:
+                        return self._extract_user_info(user_data)
+                if not hedged:
+                    hedged = True
+                    if done:
+                        print("🔄 尝试备用API...")
+                    else:
+                        print(f"⏱️ 主接口 {delay:.2f} 秒未返回，并行请求备用API...")
+                    pending.add(asyncio.ensure_future(self._fetch_profile_async(client, 1, sec_user_id)))
+            print("❌ 无法获取用户信息，可能是cookie无效或用户不存在")
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    def get_user_profile(self, sec_user_id, hedge=None):
+        """
+        获取用户详细信息
+        hedge为None时按类属性HEDGE(环境变量DOUYIN_HEDGE_PROFILE=1)决定是否使用对冲请求
+        """
+        self.last_error = None
         try:
+            if self.HEDGE if hedge is None else hedge:
+                return self._get_user_profile_hedged(sec_user_id)
+            
             # 方法1: 使用官方API
             params = {
                 "publish_video_strategy_type": 2,
@@ -59,8 +190,8 @@ class DouyinUserInfo:
             }
             resp = self.request.getJSON('/aweme/v1/web/user/profile/other/', params)
             
-            if resp and 'user' in resp:
-                user_data = resp['user']
+            user_data = self._profile_data(resp, 'user')
+            if user_data:
                 return self._extract_user_info(user_data)
             
             # 方法2: 备用API
@@ -68,8 +199,46 @@ class DouyinUserInfo:
             params2 = {"sec_uid": sec_user_id}
             resp2 = self.request.getJSON('/web/api/v2/user/info/', params2)
             
-            if resp2 and 'user_info' in resp2:
-                user_data = resp2['user_info']
+            user_data = self._profile_data(resp2, 'user_info')
+            if user_data:
+                return self._extract_user_info(user_data)
+                
+            print("❌ 无法获取用户信息，可能是cookie无效或用户不存在")
+            return None
+            
+        except Exception as e:
+            print(f"❌ 获取用户信息失败: {e}")
+            return None
+    
+    async def get_user_profile_async(self, sec_user_id, client=None, hedge=None):
+        """
+        异步获取用户详细信息，逻辑与get_user_profile一致
+        client为共享的douyin_async.AsyncRequest，多个用户并发时应复用同一个
+        """
+        own_client = client is None
+        if own_client:
+            client = douyin_async.AsyncRequest(request=self.request)
+        self.last_error = None
+        try:
+            if self.HEDGE if hedge is None else hedge:
+                return await self._get_user_profile_hedged_async(client, sec_user_id)
+            
+            params = {
+                "publish_video_strategy_type": 2,
+                "sec_user_id": sec_user_id, 
+                "personal_center_strategy": 1
+            }
+            resp = await client.getJSON('/aweme/v1/web/user/profile/other/', params)
+            
+            user_data = self._profile_data(resp, 'user')
+            if user_data:
+                return self._extract_user_info(user_data)
+            
+            print("🔄 尝试备用API...")
+            resp2 = await client.getJSON('/web/api/v2/user/info/', {"sec_uid": sec_user_id})
+            
+            user_data = self._profile_data(resp2, 'user_info')
+            if user_data:
                 return self._extract_user_info(user_data)
                 
             print("❌ 无法获取用户信息，可能是cookie无效或用户不存在")
@@ -78,6 +247,9 @@ class DouyinUserInfo:
         except Exception as e:
             print(f"❌ 获取用户信息失败: {e}")
             return None
+        finally:
+            if own_client:
+                await client.close()
     
     def _extract_user_info(self, user_data):
         """提取关键用户信息"""
@@ -189,39 +361,26 @@ def main():
     
     # 获取cookie
     cookie = ''
-    cookie_config_file = 'config/cookie_config.txt'
+    store = douyin_cookie_store.get_store()
     
-    # 优先从新的配置文件读取
-    if os.path.exists(cookie_config_file):
+    # 优先从cookie存储(或新的配置文件)读取
+    if os.path.exists(store.path) or os.path.exists(store.legacy_text):
         print("✅ 发现Cookie配置文件")
         try:
-            with open(cookie_config_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            for line in lines:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                
-                if line.startswith('cookie='):
-                    cookie = line[7:].strip()
-                    if cookie:
-                        print("✅ 从配置文件读取到cookie")
-                        break
-                elif line.startswith('browser='):
-                    browser = line[8:].strip()
-                    if browser in ['chrome', 'edge']:
-                        cookie = browser
-                        print(f"✅ 将使用{browser}浏览器自动获取cookie")
-                        break
+            config = douyin_config_cache.read_cookie_store(store)
+            if config['cookie']:
+                cookie = config['cookie']
+                print("✅ 从配置文件读取到cookie")
+            elif config['browser'] in ['chrome', 'edge']:
+                cookie = config['browser']
+                print(f"✅ 将使用{cookie}浏览器自动获取cookie")
         except Exception as e:
             print(f"❌ 读取Cookie配置文件失败: {e}")
     
     # 兼容旧版本：如果没有新配置文件，尝试读取旧的cookie.txt
     if not cookie and os.path.exists('config/cookie.txt'):
         print("✅ 发现旧版cookie文件")
-        with open('config/cookie.txt', 'r', encoding='utf-8') as f:
-            cookie = f.read().strip()
+        cookie = douyin_config_cache.read_text('config/cookie.txt').strip()
     
     # 如果仍然没有cookie，提示用户输入
     if not cookie:
@@ -0,0 +1,281 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_http.py
+@Desc    :   进程内共享的HTTP会话，按host复用keep-alive连接
+'''
+import http.cookiejar
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+try:
+    import douyin_cassette
+    import douyin_errors
+    import douyin_watchdog
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_cassette
+    import douyin_errors
+    import douyin_watchdog
+
+# 连接池配置，可通过环境变量或configure()调整
+POOL_CONNECTIONS = int(os.environ.get('DOUYIN_POOL_CONNECTIONS', '16'))  # 保留连接池的host数量
+POOL_MAXSIZE = int(os.environ.get('DOUYIN_POOL_MAXSIZE', '16'))  # 每个host保留的连接数
+# 超时配置(秒)，可通过环境变量或configure()调整
+CONNECT_TIMEOUT = float(os.environ.get('DOUYIN_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.environ.get('DOUYIN_READ_TIMEOUT', '15'))  # 两次读到数据之间的最长间隔
+TOTAL_TIMEOUT = float(os.environ.get('DOUYIN_TOTAL_TIMEOUT', '30'))  # 从发出请求到读完body的总时限，0为不限
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)  # (连接超时, 读取超时)
+# Coze流式对话的(连接超时, 两个事件间的读取超时)和总时限，SDK默认的读取超时是600秒
+COZE_TIMEOUT = (CONNECT_TIMEOUT, float(os.environ.get('DOUYIN_COZE_READ_TIMEOUT', '60')))
+COZE_TOTAL_TIMEOUT = float(os.environ.get('DOUYIN_COZE_TOTAL_TIMEOUT', '180'))
+BODY_CHUNK_SIZE = 64 * 1024
+# 把抖音相关域名的请求改发到指定地址(例如douyin_mock的本地服务)，原域名放在Host头里
+HOST_OVERRIDE = os.environ.get('DOUYIN_HOST_OVERRIDE', '').rstrip('/')
+OVERRIDE_SUFFIXES = ('douyin.com', 'douyinvod.com', 'douyinpic.com', 'douyincdn.com', 'zjcdn.com')
+
+_session = None
+_lock = threading.Lock()
+
+
+def _json_backends() -> dict:
+    backends = {'json': json.loads}
+    try:
+        import ujson
+        backends['ujson'] = ujson.loads
+    except ImportError:
+        pass
+    try:
+        import orjson
+        backends['orjson'] = orjson.loads
+    except ImportError:
+        pass
+    return backends
+
+
+# JSON解码后端：orjson(可选) > ujson > json，可通过环境变量DOUYIN_JSON_BACKEND或set_json_backend()指定
+JSON_BACKENDS = _json_backends()
+JSON_BACKEND = os.environ.get('DOUYIN_JSON_BACKEND', '') or next(
+    name for name in ('orjson', 'ujson', 'json') if name in JSON_BACKENDS)
+loads = JSON_BACKENDS.get(JSON_BACKEND, json.loads)
+
+
+def set_json_backend(name: str):
+    global JSON_BACKEND, loads
+    if name not in JSON_BACKENDS:
+        raise ValueError(f'JSON后端不可用: {name}, 可选: {", ".join(JSON_BACKENDS)}')
+    JSON_BACKEND = name
+    loads = JSON_BACKENDS[name]
+
+
+class JSONResult(dict):
+    """
+    getJSON的返回值：本身就是解析后的body(失败时为空dict)，另外携带状态码和耗时
+    调用方原有的 `if not resp` / `resp.get(...)` 写法不需要改，失败原因见error
+    """
+
+    def __init__(self, body=None, status: int = 0, elapsed: float = 0.0, decode_time: float = 0.0,
+                 url: str = '', size: int = 0, error: douyin_errors.DouyinError = None):
+        super().__init__(body or {})
+        self.status = status  # HTTP状态码
+        self.elapsed = elapsed  # 发出请求到读完body的秒数
+        self.decode_time = decode_time  # 解码body的秒数
+        self.url = url
+        self.size = size  # body字节数
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200 and bool(self)
+
+    def __repr__(self):
+        return f'JSONResult(status={self.status}, elapsed={self.elapsed:.3f}, size={self.size}, body={dict.__repr__(self)[:200]})'
+
+
+def decode_json(body: bytes, status: int, url: str = '', elapsed: float = 0.0, retry_after=0.0):
+    """
+    只解码一次body，返回(JSONResult, 错误)；
+    非200、空body、无法解析或status_code非0时JSONResult为空，错误为douyin_errors中对应的异常
+    """
+    start = time.perf_counter()
+    result = None
+    error = None
+    fields = {'status': status, 'body': body, 'url': url}
+    if status != 200:
+        error = douyin_errors.http_error(retry_after=retry_after, **fields)
+    elif not body:
+        error = douyin_errors.EmptyResponse(**fields)
+    else:
+        try:
+            result = loads(body)
+        except ValueError as e:
+            error = douyin_errors.DecodeError(f'JSON解析失败: {e}', **fields)
+        else:
+            if not isinstance(result, dict):
+                error = douyin_errors.DecodeError(f'响应不是JSON对象: {type(result).__name__}', **fields)
+            elif result.get('status_code', 0) != 0:
+                error = douyin_errors.APIError(f'status_code: {result.get("status_code")}, {result.get("status_msg", "")}',
+                                               status_code=result.get('status_code'), **fields)
+    decode_time = time.perf_counter() - start
+    if error:
+        result = None
+    return JSONResult(result, status, elapsed, decode_time, url, len(body or b''), error), error
+
+
+class NoCookiePolicy(http.cookiejar.DefaultCookiePolicy):
+    """
+    会话在所有Request实例间共享，不保存服务端下发的cookie，cookie一律由调用方显式传入
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+def new_session(pool_connections: int = None, pool_maxsize: int = None) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections or POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize or POOL_MAXSIZE,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.cookies.set_policy(NoCookiePolicy())
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = new_session()
+    return _session
+
+
+def configure(pool_connections: int = None, pool_maxsize: int = None, timeout=None, total_timeout: float = None):
+    """
+    调整连接池大小和默认超时，已有连接会被关闭
+    """
+    global _session, POOL_CONNECTIONS, POOL_MAXSIZE, TIMEOUT, TOTAL_TIMEOUT
+    with _lock:
+        POOL_CONNECTIONS = pool_connections or POOL_CONNECTIONS
+        POOL_MAXSIZE = pool_maxsize or POOL_MAXSIZE
+        TIMEOUT = timeout or TIMEOUT
+        TOTAL_TIMEOUT = TOTAL_TIMEOUT if total_timeout is None else total_timeout
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def set_host_override(base: str):
+    global HOST_OVERRIDE
+    HOST_OVERRIDE = (base or '').rstrip('/')
+
+
+def redirect_host(url: str, headers: dict = None):
+    """
+    设置了HOST_OVERRIDE时返回改写后的(url, headers)，否则原样返回
+    """
+    if not HOST_OVERRIDE:
+        return url, headers
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if not any(host == suffix or host.endswith('.' + suffix) for suffix in OVERRIDE_SUFFIXES):
+        return url, headers
+    path = parts.path or '/'
+    url = f'{HOST_OVERRIDE}{path}?{parts.query}' if parts.query else f'{HOST_OVERRIDE}{path}'
+    return url, dict(headers or {}, Host=parts.netloc)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """超过总时限(服务端持续慢速返回数据时读取超时不会触发)"""
+
+
+def _read_chunks(response: requests.Response, chunk_size: int):
+    read1 = getattr(response.raw, 'read1', None)
+    if response._content_consumed or read1 is None:
+        yield from response.iter_content(chunk_size)
+        return
+    # urllib3>=2的read1收到数据就返回，不会为凑满chunk_size一直等待慢速返回的服务端
+    try:
+        yield from iter(lambda: read1(chunk_size, decode_content=True), b'')
+    except urllib3.exceptions.ReadTimeoutError as e:
+        raise requests.exceptions.ReadTimeout(e)
+    except urllib3.exceptions.DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e)
+    except (urllib3.exceptions.ProtocolError, urllib3.exceptions.SSLError) as e:
+        raise requests.exceptions.ConnectionError(e)
+    response._content_consumed = True
+
+
+def iter_content(response: requests.Response, chunk_size: int = BODY_CHUNK_SIZE, deadline: float = None):
+    """
+    按块读取body并检查总时限，deadline为time.monotonic()的绝对时间
+    单次读取仍受读取超时限制，因此实际耗时最多超出总时限一个读取超时
+    """
+    for chunk in _read_chunks(response, chunk_size):
+        if deadline and time.monotonic() > deadline:
+            response.close()
+            raise DeadlineExceeded(f'超过总时限: {response.url}')
+        douyin_watchdog.beat()
+        yield chunk
+
+
+def send(method: str, url: str, total_timeout: float = None, **kwargs) -> requests.Response:
+    url, headers = redirect_host(url, kwargs.pop('headers', None))
+    total_timeout = TOTAL_TIMEOUT if total_timeout is None else total_timeout
+    if not total_timeout or kwargs.get('stream'):
+        return get_session().request(method, url, headers=headers, **kwargs)
+    # 以流式读取body，每读一块检查一次总时限
+    deadline = time.monotonic() + total_timeout
+    response = get_session().request(method, url, headers=headers, stream=True, **kwargs)
+    try:
+        response._content = b''.join(iter_content(response, deadline=deadline))
+    finally:
+        response.close()
+    response._content_consumed = True
+    return response
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    所有请求都带超时：timeout为(连接, 读取)，total_timeout为总时限(默认TOTAL_TIMEOUT，stream=True时由调用方用iter_content控制)
+    """
+    kwargs.setdefault('timeout', TIMEOUT)
+    douyin_watchdog.beat()
+    cassette = douyin_cassette.get_cassette()
+    if cassette.mode != 'off':
+        # 录制/回放模式，见douyin_cassette
+        return cassette.send(send, method, url, **kwargs)
+    return send(method, url, **kwargs)
+
+
+def coze_http_client():
+    """
+    Coze SDK使用的httpx客户端，超时改为COZE_TIMEOUT
+    """
+    import httpx
+    from cozepy import SyncHTTPClient
+    return SyncHTTPClient(timeout=httpx.Timeout(COZE_TIMEOUT[1], connect=COZE_TIMEOUT[0]))
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def head(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault('allow_redirects', False)
+    return request('HEAD', url, **kwargs)
+
+
+def post(url: str, data=None, **kwargs) -> requests.Response:
+    return request('POST', url, data=data, **kwargs)
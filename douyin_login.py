@@ -0,0 +1,189 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_login.py
+@Desc    :   登录状态缓存：check_login结果按TTL缓存，用cookie的过期时间预测登录何时失效，
+             后台线程在缓存过期或登录临近失效前重新检查
+'''
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import unquote
+
+from loguru import logger
+
+try:
+    import douyin_http
+    import douyin_singleflight
+    import douyin_webid
+    from douyin_cookies import cookies_str_to_dict
+except ImportError:
+    # 处理直接运行时的导入
+    import douyin_http
+    import douyin_singleflight
+    import douyin_webid
+    from douyin_cookies import cookies_str_to_dict
+
+CHECK_LOGIN_URL = 'https://sso.douyin.com/check_login/'
+# check_login结果的缓存时间(秒)
+TTL = float(os.environ.get('DOUYIN_LOGIN_TTL', '600'))
+# 距离预测的失效时间不足该秒数时视为即将过期
+REFRESH_MARGIN = float(os.environ.get('DOUYIN_LOGIN_REFRESH_MARGIN', '600'))
+# 后台检查的间隔(秒)
+POLL_INTERVAL = 30.0
+# 用这些字段的过期时间判断登录态何时失效
+EXPIRY_FIELDS = ('sessionid', 'sessionid_ss', 'sid_guard', 'uid_tt')
+
+
+def sid_guard_expiry(value: str) -> Optional[float]:
+    """
+    sid_guard形如"sid|签发时间|有效秒数|日期"，返回签发时间+有效秒数，格式不对时返回None
+    """
+    parts = unquote(value or '').split('|')
+    try:
+        return float(parts[1]) + float(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def predict_expiry(cookie_dict: dict, expires: dict = None) -> Optional[float]:
+    """
+    登录态最早的失效时间(unix秒)：浏览器给出的EXPIRY_FIELDS过期时间和sid_guard中的有效期取最小值
+    会话cookie和无法判断时为None
+    """
+    values = [(expires or {}).get(name) for name in EXPIRY_FIELDS]
+    values.append(sid_guard_expiry(cookie_dict.get('sid_guard')))
+    values = [value for value in values if value and value > 0]
+    return min(values) if values else None
+
+
+def check_login(cookie_dict: dict) -> bool:
+    """
+    请求check_login接口，返回是否已登录
+    """
+    return douyin_http.get(CHECK_LOGIN_URL, cookies=cookie_dict).json().get('has_login') is True
+
+
+class LoginCache(object):
+    """
+    {cookie指纹: {'valid', 'checked', 'expires'}}
+    结果在TTL内且未到预测的失效时间时直接返回；已过预测失效时间的cookie不再请求，直接判定失效
+    同一cookie的并发检查只请求一次，请求失败不缓存
+    """
+
+    def __init__(self, ttl: float = TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.checks = 0
+        self.hits = 0
+        self.predicted = 0
+
+    @staticmethod
+    def parse(cookie) -> dict:
+        return cookie if isinstance(cookie, dict) else cookies_str_to_dict(cookie)
+
+    def status(self, cookie, expires: dict = None, force: bool = False) -> dict:
+        """
+        返回{'valid', 'checked', 'expires'}，force为True时忽略缓存重新请求
+        """
+        cookie_dict = self.parse(cookie)
+        key = douyin_webid.cookie_fingerprint(cookie_dict)
+        predicted = predict_expiry(cookie_dict, expires)
+        now = time.time()
+        if predicted is not None and now >= predicted:
+            with self.lock:
+                self.predicted += 1
+                entry = self.entries[key] = {'valid': False, 'checked': now, 'expires': predicted}
+            return dict(entry)
+        entry = self.entries.get(key)
+        if not force and entry is not None and now - entry['checked'] < self.ttl:
+            self.hits += 1
+            return dict(entry)
+
+        def check():
+            self.checks += 1
+            return check_login(cookie_dict)
+
+        valid = douyin_singleflight.group('check_login').do(key, check)
+        entry = {'valid': valid, 'checked': time.time(), 'expires': predicted}
+        with self.lock:
+            self.entries[key] = entry
+        return dict(entry)
+
+    def is_valid(self, cookie, expires: dict = None, force: bool = False) -> bool:
+        return self.status(cookie, expires, force)['valid']
+
+    def refresh_due(self, cookie, expires: dict = None) -> float:
+        """
+        应当重新检查的时间：缓存结果过期前，或预测失效时间前REFRESH_MARGIN秒，取较早者；从未检查过时为0
+        """
+        cookie_dict = self.parse(cookie)
+        entry = self.entries.get(douyin_webid.cookie_fingerprint(cookie_dict))
+        if entry is None:
+            return 0.0
+        due = entry['checked'] + self.ttl - POLL_INTERVAL
+        predicted = predict_expiry(cookie_dict, expires)
+        if predicted is not None:
+            due = min(due, predicted - REFRESH_MARGIN)
+        return due
+
+    def invalidate(self, cookie=None):
+        with self.lock:
+            if cookie is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(douyin_webid.cookie_fingerprint(self.parse(cookie)), None)
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'checks': self.checks, 'hits': self.hits, 'predicted_expired': self.predicted}
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_cache() -> LoginCache:
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = LoginCache()
+        return _cache
+
+
+class Refresher(object):
+    """
+    后台线程：每POLL_INTERVAL秒调用source()取得当前的(cookie, expires)，
+    到了refresh_due的时间就重新检查，检查结果为未登录时调用on_invalid(cookie, 原因)
+    这样主流程读到的总是缓存中的新鲜结果，不会在处理链接时才发现cookie已失效
+    """
+
+    def __init__(self, source, on_invalid, cache: LoginCache = None, interval: float = POLL_INTERVAL):
+        self.source = source
+        self.on_invalid = on_invalid
+        self.cache = cache or get_cache()
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='login-refresher', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.warning(f'后台检查登录状态失败: {e}')
+
+    def tick(self):
+        cookie, expires = self.source()
+        if not cookie or time.time() < self.cache.refresh_due(cookie, expires):
+            return
+        status = self.cache.status(cookie, expires, force=True)
+        if not status['valid']:
+            self.on_invalid(cookie, '登录已过期' if status['expires'] and status['expires'] <= time.time() else '登录检查未通过')
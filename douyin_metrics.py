@@ -0,0 +1,79 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_metrics.py
+@Desc    :   按接口统计请求耗时的直方图，用于估算分位数(例如对冲请求的等待时间)
+'''
+import bisect
+import threading
+
+
+def _bounds(low: float = 0.001, high: float = 120.0, factor: float = 1.2) -> list:
+    bounds = []
+    value = low
+    while value < high:
+        bounds.append(round(value, 6))
+        value *= factor
+    return bounds
+
+
+class LatencyHistogram(object):
+    """
+    指数分桶(1ms ~ 120s，相邻桶相差20%)，分位数取所在桶的上界，误差不超过20%
+    """
+    BOUNDS = _bounds()
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self.BOUNDS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, q: float) -> float:
+        """
+        q为0~1之间的分位，没有样本时返回0
+        """
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for index, n in enumerate(self.counts):
+                seen += n
+                if seen >= rank and n:
+                    return self.BOUNDS[index] if index < len(self.BOUNDS) else self.BOUNDS[-1]
+        return self.BOUNDS[-1]
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 4) if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def histogram(name: str) -> LatencyHistogram:
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = LatencyHistogram()
+        return _histograms[name]
+
+
+def observe(name: str, seconds: float):
+    histogram(name).observe(seconds)
+
+
+def stats() -> dict:
+    return {name: h.snapshot() for name, h in _histograms.items()}
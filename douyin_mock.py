@@ -0,0 +1,252 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_mock.py
+@Desc    :   本地模拟抖音服务，按Host头分发到各个域名的接口，用于离线压测
+'''
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from loguru import logger
+
+# 模拟数据和行为的默认配置，均可通过start_mock()/命令行覆盖
+DEFAULTS = {
+    'latency': 0.0,  # 每个请求的平均延迟(秒)
+    'jitter': 0.0,  # 延迟的随机浮动(秒)
+    'slow_rate': 0.0,  # 长尾请求的比例
+    'slow_latency': 0.0,  # 长尾请求额外的延迟(秒)
+    'error_rate': 0.0,  # 返回500的比例
+    'empty_rate': 0.0,  # 返回200空响应(模拟签名校验失败)的比例
+    'rps': 0.0,  # 每秒最多处理的API请求数，超出返回429，0为不限
+    'videos': 60,  # 每个用户的作品数
+    'desc_size': 50,  # 每个作品描述的字符数，用于调整响应体大小
+    'video_size': 2 * 1024 * 1024,  # 视频文件字节数
+    'homepage_size': 500 * 1024,  # 首页HTML字节数
+    'webid_offset': 100 * 1024,  # user_unique_id在首页中的位置
+    'webid': '7390000000000000000',
+}
+VIDEO_HOST = 'v26-web.douyinvod.com'
+
+
+def stable_int(text: str, mod: int) -> int:
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16) % mod
+
+
+def make_user(sec_user_id: str, videos: int) -> dict:
+    n = stable_int(sec_user_id, 10 ** 6)
+    return {
+        'nickname': f'用户{n}',
+        'signature': f'模拟签名{n}',
+        'sec_user_id': sec_user_id,
+        'uid': str(10 ** 10 + n),
+        'unique_id': f'mock{n}',
+        'avatar_thumb': {'url_list': [f'https://p3-pc.douyinpic.com/aweme/100x100/{n}.jpeg']},
+        'ip_location': 'IP属地：北京',
+        'follower_count': n * 3,
+        'following_count': n % 500,
+        'aweme_count': videos,
+        'total_favorited': n * 17,
+    }
+
+
+def make_aweme(sec_user_id: str, i: int, desc_size: int) -> dict:
+    aweme_id = str(7 * 10 ** 18 + stable_int(sec_user_id, 10 ** 6) * 10 ** 4 + i)
+    return {
+        'aweme_id': aweme_id,
+        'aweme_type': 0,
+        'desc': f'作品{i} ' + 'x' * desc_size,
+        'create_time': 1700000000 - i * 3600,
+        'video': {
+            'play_addr': {'url_list': [f'https://{VIDEO_HOST}/video/{aweme_id}.mp4']},
+            'cover': {'url_list': [f'https://p3-pc.douyinpic.com/cover/{aweme_id}.jpeg']},
+        },
+        'statistics': {'play_count': i * 100, 'digg_count': i * 10, 'comment_count': i},
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self) -> dict:
+        return self.server.config
+
+    def do_HEAD(self):
+        self.dispatch('HEAD')
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.dispatch('POST')
+
+    def dispatch(self, method: str):
+        host = self.headers.get('Host', '').split(':')[0]
+        parts = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        self.server.count(host, parts.path)
+        config = self.config
+        if config['latency'] or config['jitter']:
+            time.sleep(max(0.0, config['latency'] + random.uniform(-config['jitter'], config['jitter'])))
+        if config['slow_rate'] and random.random() < config['slow_rate']:
+            time.sleep(config['slow_latency'])
+        try:
+            if host == 'sso.douyin.com':
+                return self.check_login()
+            if host == 'v.douyin.com':
+                return self.short_link(parts.path)
+            if host.endswith('douyin.com') or host in ('127.0.0.1', 'localhost'):
+                if parts.path == '/':
+                    return self.homepage(method)
+                return self.api(parts.path, query)
+            return self.video(method, parts.path)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send(self, status: int, body: bytes = b'', headers: dict = None, method: str = 'GET'):
+        self.send_response(status)
+        headers = headers or {}
+        headers.setdefault('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if method != 'HEAD' and body:
+            self.wfile.write(body)
+
+    def send_json(self, data: dict):
+        self.send(200, json.dumps(data, ensure_ascii=False).encode('utf-8'), {'Content-Type': 'application/json'})
+
+    def api(self, path: str, query: dict):
+        config = self.config
+        if not self.server.allow():
+            return self.send(429, b'', {'Retry-After': '1'})
+        roll = random.random()
+        if roll < config['error_rate']:
+            return self.send(500, b'server error')
+        if roll < config['error_rate'] + config['empty_rate']:
+            return self.send(200, b'')
+        if path == '/aweme/v1/web/user/profile/other/':
+            return self.send_json({'status_code': 0, 'user': make_user(query.get('sec_user_id', ''), config['videos'])})
+        if path == '/web/api/v2/user/info/':
+            return self.send_json({'status_code': 0, 'user_info': make_user(query.get('sec_uid', ''), config['videos'])})
+        if path == '/aweme/v1/web/aweme/post/':
+            # max_cursor直接用作偏移量
+            sec_user_id = query.get('sec_user_id', '')
+            start = int(query.get('max_cursor', 0) or 0)
+            end = min(config['videos'], start + int(query.get('count', 18) or 18))
+            return self.send_json({
+                'status_code': 0,
+                'aweme_list': [make_aweme(sec_user_id, i, config['desc_size']) for i in range(start, end)],
+                'max_cursor': end,
+                'has_more': int(end < config['videos']),
+            })
+        self.send(404, b'not found')
+
+    def homepage(self, method: str):
+        config = self.config
+        marker = f'<script>self.__pace_f.push([1,"{{\\"user_unique_id\\":\\"{config["webid"]}\\"}}"])</script>'.encode()
+        offset = min(config['webid_offset'], config['homepage_size'])
+        body = b'<html>' + b' ' * offset + marker + b' ' * max(0, config['homepage_size'] - offset) + b'</html>'
+        self.send(200, body, {'Content-Type': 'text/html; charset=utf-8'}, method)
+
+    def check_login(self):
+        cookie = self.headers.get('Cookie', '')
+        self.send_json({'has_login': 'sessionid=' in cookie, 'status_code': 0})
+
+    def short_link(self, path: str):
+        code = path.strip('/') or 'mock'
+        location = f'https://www.douyin.com/user/MS4wLjABAAAA{code}'
+        self.send(302, b'', {'Location': location})
+
+    def video(self, method: str, path: str):
+        size = self.config['video_size']
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or size - 1), size - 1)
+            headers = {'Content-Type': 'video/mp4', 'Content-Range': f'bytes {start}-{end}/{size}',
+                       'Content-Length': str(end - start + 1)}
+            return self.send(206, b'\0' * (end - start + 1), headers, method)
+        self.send(200, b'\0' * size if method != 'HEAD' else b'',
+                  {'Content-Type': 'video/mp4', 'Content-Length': str(size)}, method)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: dict):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.window = []
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开(例如流式提取webid)是预期行为，不打印堆栈
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def count(self, host: str, path: str):
+        key = f'{host}{path}'
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def allow(self) -> bool:
+        """
+        滑动窗口限流，超过rps返回False
+        """
+        rps = self.config['rps']
+        if not rps:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            self.window = [t for t in self.window if now - t < 1]
+            if len(self.window) >= rps:
+                return False
+            self.window.append(now)
+            return True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_mock(host: str = '127.0.0.1', port: int = 0, **config) -> MockServer:
+    """
+    在后台线程启动模拟服务，配合douyin_http.set_host_override(server.base_url)使用
+    """
+    server = MockServer((host, port), dict(DEFAULTS, **config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f'模拟抖音服务已启动: {server.base_url}')
+    return server
+
+
+if __name__ == "__main__":
+    # python douyin_mock.py --port 8765 --latency 0.05 --rps 50
+    import argparse
+    parser = argparse.ArgumentParser(description='本地模拟抖音服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    for key, value in DEFAULTS.items():
+        parser.add_argument(f'--{key.replace("_", "-")}', type=type(value), default=value)
+    args = vars(parser.parse_args())
+    host, port = args.pop('host'), args.pop('port')
+    server = MockServer((host, port), args)
+    logger.info(f'模拟抖音服务已启动: {server.base_url}')
+    logger.info(f'设置环境变量 DOUYIN_HOST_OVERRIDE={server.base_url} 后运行爬虫即可访问本服务')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,165 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_ratelimit.py
+@Desc    :   进程内共享的令牌桶限速器，按接口分别配额，收到限流信号时退避
+'''
+import asyncio
+import email.utils
+import os
+import threading
+import time
+
+from loguru import logger
+
+# 各接口默认配额：(每秒令牌数, 桶容量)
+# 可通过环境变量覆盖，例如 DOUYIN_RATE_LIMITS="douyin_api=2:3,coze=0.5:1"
+BUDGETS = {
+    'douyin_api': (2.0, 3),  # www.douyin.com的JSON接口
+    'douyin_page': (1.0, 1),  # 首页/用户主页HTML
+    'coze': (0.5, 1),  # Coze对话接口
+    'url': (0.2, 1),  # 批处理中每条链接的整体节奏
+}
+BACKOFF_BASE = 1.0  # 连续失败时的退避秒数：1, 2, 4, ...
+BACKOFF_MAX = 60.0
+
+
+def _parse_budgets(text: str) -> dict:
+    budgets = {}
+    for item in filter(None, text.split(',')):
+        name, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        budgets[name.strip()] = (float(rate), int(burst or 1))
+    return budgets
+
+
+def parse_retry_after(value) -> float:
+    """
+    Retry-After可以是秒数也可以是HTTP日期，无法解析时返回0
+    """
+    if not value:
+        return 0.0
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket(object):
+    """
+    令牌按rate持续补充，最多积累burst个；服务端要求等待时在blocked_until之前不发放令牌
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.waited = 0.0  # 累计等待秒数
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        预订令牌并返回需要等待的秒数，等待在锁外进行
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            wait = max(wait, self.blocked_until - now)
+            self.waited += wait
+            return wait
+
+    def block(self, seconds: float):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def feedback(self, ok: bool, retry_after: float = 0.0) -> float:
+        """
+        根据响应调整节奏：成功则清零失败计数，失败按指数退避，Retry-After优先
+        """
+        if ok and not retry_after:
+            self.failures = 0
+            return 0.0
+        self.failures += 1
+        delay = retry_after or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+        self.block(delay)
+        return delay
+
+
+class RateLimiter(object):
+
+    def __init__(self, budgets: dict = None):
+        self.budgets = dict(BUDGETS, **(budgets or {}))
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        with self.lock:
+            if endpoint not in self.buckets:
+                rate, burst = self.budgets.get(endpoint, self.budgets['douyin_api'])
+                self.buckets[endpoint] = TokenBucket(rate, burst)
+            return self.buckets[endpoint]
+
+    def configure(self, endpoint: str, rate: float, burst: int = 1):
+        with self.lock:
+            self.budgets[endpoint] = (rate, burst)
+            self.buckets.pop(endpoint, None)
+
+    def acquire(self, endpoint: str, tokens: float = 1) -> float:
+        wait = self.bucket(endpoint).reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, endpoint: str, tokens: float = 1) -> float:
+        wait = self.bucket(endpoint).reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def feedback(self, endpoint: str, ok: bool, retry_after=None) -> float:
+        delay = self.bucket(endpoint).feedback(ok, parse_retry_after(retry_after))
+        if delay:
+            logger.warning(f'{endpoint} 请求受限或失败, {delay:.1f} 秒内暂停发送')
+        return delay
+
+    def stats(self) -> dict:
+        return {name: {'waited': round(b.waited, 3), 'failures': b.failures} for name, b in self.buckets.items()}
+
+
+_limiter = None
+_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = RateLimiter(_parse_budgets(os.environ.get('DOUYIN_RATE_LIMITS', '')))
+    return _limiter
+
+
+def acquire(endpoint: str, tokens: float = 1) -> float:
+    return get_limiter().acquire(endpoint, tokens)
+
+
+async def acquire_async(endpoint: str, tokens: float = 1) -> float:
+    return await get_limiter().acquire_async(endpoint, tokens)
+
+
+def feedback(endpoint: str, ok: bool, retry_after=None) -> float:
+    return get_limiter().feedback(endpoint, ok, retry_after)
+
+
+def configure(endpoint: str, rate: float, burst: int = 1):
+    get_limiter().configure(endpoint, rate, burst)
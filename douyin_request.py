@@ -7,21 +7,60 @@
 @Link    :   https://github.com/ShilongLee/Crawler
 @Desc    :   抖音sign
 '''
-import os
 import random
-import re
+import time
+from types import MappingProxyType
 from urllib.parse import quote
 
 import requests
 from loguru import logger
 
 try:
+    import douyin_cassette
+    import douyin_errors
+    import douyin_http
+    import douyin_metrics
+    import douyin_ratelimit
+    import douyin_singleflight
+    import douyin_webid
+    from douyin_abogus import ARGUMENTS_DETAIL, ARGUMENTS_REPLY, SignContext, get_sign_context
     from douyin_cookies import get_cookie_dict
-    from douyin_execjs_fix import execjs
+    from douyin_signer import get_signer
 except ImportError:
     # 处理直接运行时的导入
+    import douyin_cassette
+    import douyin_errors
+    import douyin_http
+    import douyin_metrics
+    import douyin_ratelimit
+    import douyin_singleflight
+    import douyin_webid
+    from douyin_abogus import ARGUMENTS_DETAIL, ARGUMENTS_REPLY, SignContext, get_sign_context
     from douyin_cookies import get_cookie_dict
-    from douyin_execjs_fix import execjs
+    from douyin_signer import get_signer
+
+
+class QueryBuilder(object):
+    """
+    固定键顺序和编码规则的查询串：静态参数只编码一次，每次请求只追加动态参数
+    签名的字符串就是实际发送的查询串，不再经过requests二次编码
+    """
+
+    def __init__(self, base: dict):
+        self.base_keys = set(base)
+        self.base = self.encode(base)
+
+    @staticmethod
+    def encode(params: dict) -> str:
+        # 值为None的键不参与签名也不发送(与requests处理params时一致)
+        return '&'.join([f'{k}={quote(str(v))}' for k, v in params.items() if v is not None])
+
+    def build(self, params: dict) -> str:
+        """
+        静态参数在前，params按传入顺序在后，与静态参数重名的键以静态参数为准
+        """
+        extra = self.encode({k: v for k, v in params.items() if k not in self.base_keys})
+        return f'{self.base}&{extra}' if extra else self.base
 
 
 class Request(object):
@@ -75,97 +114,205 @@ class Request(object):
         "accept": "application/json, text/plain, */*",
         "dnt": "1",
     }
-    filepath = os.path.dirname(__file__)
-    SIGN = execjs.compile(
-        open(os.path.join(filepath, 'js/douyin.js'), 'r', encoding='utf-8').read())
+    # 签名后端：native(纯Python) / node(常驻进程池) / execjs，为空时取环境变量DOUYIN_SIGN_BACKEND
+    SIGN_BACKEND = ''
+    # getJSON的默认重试策略，只重试超时、429、5xx和空响应
+    RETRY = douyin_errors.RetryPolicy()
     WEBID = ''
 
     def __init__(self, cookie='', UA=''):
         self.COOKIES = get_cookie_dict(cookie)
+        # 类属性只作为默认模板，每个实例复制一份，不同cookie/UA的实例可以在同一进程中并发使用
+        headers = dict(type(self).HEADERS)
+        params = dict(type(self).PARAMS)
         if UA:  # 如果需要访问搜索页面源码等内容，需要提供cookie对应的UA
             version = UA.split(' Chrome/')[1].split(' ')[0]
             _version = version.split('.')[0]
-            self.HEADERS.update({
+            headers.update({
                 "User-Agent": UA,  # 主要是这个
                 "sec-ch-ua": f'"Chromium";v="{_version}", "Not(A:Brand";v="24", "Google Chrome";v="{_version}"',
             })
-            self.PARAMS.update({
+            params.update({
                 "browser_version": version,
                 "engine_version": version,  # 主要是这个
             })
+        # 构造完成后只读，需要修改时应新建实例
+        self.HEADERS = MappingProxyType(headers)
+        self.PAGE_HEADERS = MappingProxyType(dict(headers, **{'sec-fetch-dest': 'document'}))
+        self.PARAMS = MappingProxyType(params)
+        # 只依赖cookie的动态参数在这里算好，msToken缺失时也只随机生成一次
+        self.COOKIE_PARAMS = MappingProxyType({
+            'msToken': self.get_ms_token(),
+            'verifyFp': self.COOKIES.get('s_v_web_id', None),
+            'fp': self.COOKIES.get('s_v_web_id', None),
+        })
+        self.QUERY = QueryBuilder({
+            **params,
+            'screen_width': self.COOKIES.get('dy_swidth', 2560),
+            'screen_height': self.COOKIES.get('dy_sheight', 1440),
+            'cpu_core_num': self.COOKIES.get('device_web_cpu_core', 24),
+            'device_memory': self.COOKIES.get('device_web_memory_size', 8),
+        })
 
-    def get_sign(self, uri: str, params: dict) -> dict:
-        query = '&'.join([f'{k}={quote(str(v))}' for k, v in params.items()])
+    @property
+    def SIGN(self):
+        # 多个实例共享同一组常驻签名进程
+        return get_signer(self.SIGN_BACKEND)
+
+    def get_sign_context(self, uri: str = '') -> SignContext:
+        """
+        当前UA对应的预计算签名上下文，同一UA的实例共享，只需对查询串做哈希
+        """
+        arguments = ARGUMENTS_REPLY if 'reply' in uri else ARGUMENTS_DETAIL
+        return get_sign_context(self.HEADERS.get("User-Agent"), arguments)
+
+    def get_sign_call(self, uri: str, params) -> tuple:
+        """
+        返回(签名函数名, 查询串, UA)，params可以是dict或已编码的查询串
+        """
+        query = params if isinstance(params, str) else QueryBuilder.encode(params)
         call_name = 'sign_datail'
         if 'reply' in uri:
             call_name = 'sign_reply'
-        a_bogus = self.SIGN.call(
-            call_name, query, self.HEADERS.get("User-Agent"))
+        return call_name, query, self.HEADERS.get("User-Agent")
+
+    def get_sign(self, uri: str, params: dict) -> dict:
+        a_bogus = self.SIGN.call(*self.get_sign_call(uri, params))
         return a_bogus
 
+    def sign_many(self, items: list) -> list:
+        """
+        批量签名，items为[(uri, params), ...]，一次交给签名后端，按顺序返回a_bogus
+        """
+        calls = [self.get_sign_call(uri, params) for uri, params in items]
+        return self.SIGN.call_many(calls)
+
     def get_params(self, params: dict) -> dict:
-        params.update(self.PARAMS)
-        params['msToken'] = self.get_ms_token()
-        params['screen_width'] = self.COOKIES.get('dy_swidth', 2560)
-        params['screen_height'] = self.COOKIES.get('dy_sheight', 1440)
-        params['cpu_core_num'] = self.COOKIES.get('device_web_cpu_core', 24)
-        params['device_memory'] = self.COOKIES.get('device_web_memory_size', 8)
-        params['verifyFp'] = self.COOKIES.get('s_v_web_id', None)
-        params['fp'] = self.COOKIES.get('s_v_web_id', None)
+        """
+        每次请求的动态参数，静态参数已预先编码在self.QUERY中，只需合并接口参数、COOKIE_PARAMS和webid
+        """
+        params = {**params, **self.COOKIE_PARAMS}
         params['webid'] = self.get_webid()
         return params
 
+    def get_query(self, params: dict) -> str:
+        return self.QUERY.build(self.get_params(params))
+
+    def get_webid_key(self) -> str:
+        return douyin_webid.cookie_fingerprint(self.COOKIES, self.HEADERS.get("User-Agent"))
+
     def get_webid(self):
         if not self.WEBID:
-            url = 'https://www.douyin.com/?recommend=1'
-            text = self.getHTML(url)
-            pattern = r'\\"user_unique_id\\":\\"(\d+)\\"'
-            match = re.search(pattern, text)
-            if match:
-                self.WEBID = match.group(1)
+            # 先查磁盘缓存，同一cookie在多个实例、多次运行间只下载一次首页
+            key = self.get_webid_key()
+            self.WEBID = douyin_webid.get_cache().get(key)
+            if self.WEBID:
+                return self.WEBID
+            # 流式读取首页，匹配到user_unique_id后立即断开，不下载剩余部分
+            douyin_ratelimit.acquire('douyin_page')
+            deadline = time.monotonic() + douyin_http.TOTAL_TIMEOUT if douyin_http.TOTAL_TIMEOUT else None
+            with douyin_http.get(douyin_webid.WEBID_URL, headers=self.PAGE_HEADERS, cookies=self.COOKIES,
+                                 stream=True) as response:
+                if response.status_code == 200:
+                    chunks = douyin_http.iter_content(response, douyin_webid.CHUNK_SIZE, deadline)
+                    self.WEBID = douyin_webid.StreamSearcher().search(chunks)
+                else:
+                    logger.error(f'HTML请求失败, url: {douyin_webid.WEBID_URL}, code: {response.status_code}')
+            if self.WEBID:
+                douyin_webid.get_cache().set(key, self.WEBID)
         return self.WEBID
 
+    def invalidate_webid(self):
+        """
+        请求被拒(200但空响应，通常是参数校验不通过)时丢弃webid，下次重新获取
+        """
+        if self.WEBID:
+            douyin_webid.get_cache().invalidate(self.get_webid_key())
+            self.WEBID = ''
+
     def get_ms_token(self, randomlength=120):
         """
         返回cookie中的msToken或随机字符串
         """
         ms_token = self.COOKIES.get('msToken', None)
         if not ms_token:
-            ms_token = ''
             base_str = 'ABCDEFGHIGKLMNOPQRSTUVWXYZabcdefghigklmnopqrstuvwxyz0123456789='
-            length = len(base_str) - 1
-            for _ in range(randomlength):
-                ms_token += base_str[random.randint(0, length)]
+            ms_token = ''.join(random.choices(base_str, k=randomlength))
         return ms_token
 
     def getHTML(self, url) -> str:
-        headers = self.HEADERS.copy()
-        headers['sec-fetch-dest'] = 'document'
-        response = requests.get(url, headers=headers, cookies=self.COOKIES)
+        headers = self.PAGE_HEADERS
+        douyin_ratelimit.acquire('douyin_page')
+        response = douyin_http.get(url, headers=headers, cookies=self.COOKIES)
         if response.status_code != 200 or response.text == '':
             logger.error(f'HTML请求失败, url: {url}, header: {headers}')
             return ''
         return response.text
 
-    def getJSON(self, uri: str, params: dict, data: dict = None):
-        url = f'{self.HOST}{uri}'
-        params = self.get_params(params)
-        params["a_bogus"] = self.get_sign(uri, params)
-        if data:
-            response = requests.post(
-                url, params=params, data=data, headers=self.HEADERS, cookies=self.COOKIES)
-        else:
-            response = requests.get(
-                url, params=params, headers=self.HEADERS, cookies=self.COOKIES)
-
-        if response.status_code != 200 or response.text == '' or response.json().get('status_code', 0) != 0:
+    def get_signed_url(self, uri: str, params: dict) -> str:
+        """
+        完整的请求URL：签名用的查询串原样发送，末尾追加a_bogus
+        """
+        query = self.get_query(params)
+        a_bogus = self.get_sign(uri, query)
+        return f'{self.HOST}{uri}?{query}&a_bogus={quote(a_bogus, safe="")}'
+
+    def fetch_json(self, uri: str, params: dict, data: dict = None) -> douyin_http.JSONResult:
+        """
+        单次请求，失败时抛出douyin_errors中对应的异常(保留状态码和原始body)
+        """
+        # 每次尝试重新签名，时间戳和msToken都是新的；没有webid时先下载首页，失败同样按传输错误处理
+        try:
+            url = self.get_signed_url(uri, params)
+        except requests.exceptions.RequestException as e:
+            raise douyin_errors.TransportError(f'获取webid失败: {e}', url=f'{self.HOST}{uri}')
+        # 回放模式下不经过限速器，离线回放不受线上接口配额限制
+        throttled = not douyin_cassette.get_cassette().replaying
+        if throttled:
+            douyin_ratelimit.acquire('douyin_api')
+        start = time.perf_counter()
+        try:
+            if data:
+                response = douyin_http.post(
+                    url, data=data, headers=self.HEADERS, cookies=self.COOKIES)
+            else:
+                response = douyin_http.get(
+                    url, headers=self.HEADERS, cookies=self.COOKIES)
+            body = response.content
+        except requests.exceptions.RequestException as e:
+            if throttled:
+                douyin_ratelimit.feedback('douyin_api', False)
+            raise douyin_errors.TransportError(str(e), url=url)
+        # body只解码一次，不再为判空单独生成response.text
+        retry_after = douyin_ratelimit.parse_retry_after(response.headers.get('Retry-After'))
+        resp, error = douyin_http.decode_json(body, response.status_code, url, time.perf_counter() - start, retry_after)
+        # 429、Retry-After或status_code非0时限速器自动退避
+        if throttled:
+            douyin_ratelimit.feedback('douyin_api', not (error and error.throttle), retry_after)
+        if error:
             logger.error(
-                f'JSON请求失败：url: {url},  params: {params}, code: {response.status_code}, body: {response.text}')
-            if os.path.exists('cookie.json'):
-                os.remove('cookie.json')
-            return {}
+                f'JSON请求失败：url: {url}, code: {response.status_code}, {error}, body: {body[:500]}')
+            if isinstance(error, douyin_errors.EmptyResponse):
+                self.invalidate_webid()
+            raise error
+        # 只统计成功的请求，用于估算各接口的耗时分位数
+        douyin_metrics.observe(uri, resp.elapsed)
+        return resp
+
+    def getJSON(self, uri: str, params: dict, data: dict = None,
+                retry: douyin_errors.RetryPolicy = None) -> douyin_http.JSONResult:
+        """
+        临时性错误按重试策略重试，最终失败时返回空的JSONResult，resp.error为最后一次的异常
+        同一cookie对同一接口和参数的并发调用只发一次请求，共享结果
+        """
+        def call():
+            try:
+                return (retry or self.RETRY).call(lambda: self.fetch_json(uri, params, data))
+            except douyin_errors.DouyinError as e:
+                return douyin_http.JSONResult(status=e.status, url=e.url, error=e)
 
-        return response.json()
+        key = douyin_singleflight.make_key(self.get_webid_key(), uri, params, data)
+        return douyin_singleflight.group('getJSON').do(key, call)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,264 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_signer.py
+@Desc    :   a_bogus签名后端：纯Python / 常驻node进程池 / execjs
+'''
+import atexit
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+from loguru import logger
+
+try:
+    from douyin_abogus import NativeSigner
+except ImportError:
+    # 处理直接运行时的导入
+    from douyin_abogus import NativeSigner
+
+FILEPATH = os.path.dirname(os.path.abspath(__file__))
+DOUYIN_JS = os.path.join(FILEPATH, 'js', 'douyin.js')
+WORKER_JS = os.path.join(FILEPATH, 'js', 'sign_worker.js')
+
+# 可通过环境变量选择签名后端和node进程数
+DEFAULT_BACKEND = os.environ.get('DOUYIN_SIGN_BACKEND', 'native')
+DEFAULT_WORKERS = int(os.environ.get('DOUYIN_SIGN_WORKERS', '1'))
+
+# execjs没有常驻进程，追加批量入口后一次调用签完整批
+BATCH_JS = '''
+function sign_many(calls) {
+    var fns = {sign_datail: sign_datail, sign_reply: sign_reply};
+    return calls.map(function (c) {
+        return fns[c[0]].apply(null, c.slice(1));
+    });
+}
+'''
+
+
+class SignerError(Exception):
+    """签名失败"""
+
+
+class SignerCrashed(SignerError):
+    """签名进程退出或无响应，需要重启"""
+
+
+class ExecjsSigner(object):
+    """
+    原有的execjs实现，外部node运行时每次调用都会启动新进程
+    """
+
+    def __init__(self, js_path=DOUYIN_JS):
+        from douyin_execjs_fix import execjs
+        with open(js_path, 'r', encoding='utf-8') as f:
+            self.ctx = execjs.compile(f.read() + BATCH_JS)
+
+    def call(self, name, *args):
+        return self.ctx.call(name, *args)
+
+    def call_many(self, calls):
+        return self.ctx.call('sign_many', [list(c) for c in calls])
+
+    def close(self):
+        pass
+
+
+class NodeWorker(object):
+    """
+    单个常驻node进程，通过stdin/stdout按行交换JSON
+    """
+
+    def __init__(self, js_path=DOUYIN_JS, node='node', timeout=10):
+        self.js_path = js_path
+        self.node = node
+        self.timeout = timeout
+        self.proc = None
+        self.lines = None
+        self.ids = itertools.count(1)
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        self.stop()
+        self.proc = subprocess.Popen(
+            [self.node, WORKER_JS, self.js_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            encoding='utf-8',
+            bufsize=1,
+        )
+        # 读线程把输出放进队列，主线程可以带超时等待
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read, args=(self.proc, self.lines), daemon=True).start()
+        logger.debug(f'签名进程已启动, pid: {self.proc.pid}')
+
+    @staticmethod
+    def _read(proc, lines):
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def call(self, name, *args, **fields):
+        """
+        fields会原样附加到请求中，例如now/random用于固定JS中的时间和随机数
+        """
+        return self.request({**fields, 'fn': name, 'args': args})
+
+    def call_many(self, calls):
+        """
+        一次往返签完整批，calls为[(fn, *args), ...]
+        """
+        return self.request({'batch': [{'fn': c[0], 'args': c[1:]} for c in calls]})
+
+    def request(self, payload: dict):
+        if not self.alive():
+            raise SignerCrashed('签名进程未运行')
+        req_id = next(self.ids)
+        try:
+            self.proc.stdin.write(json.dumps({**payload, 'id': req_id}) + '\n')
+            self.proc.stdin.flush()
+        except OSError as e:
+            raise SignerCrashed(f'写入签名进程失败: {e}')
+        try:
+            line = self.lines.get(timeout=self.timeout)
+        except queue.Empty:
+            raise SignerCrashed(f'签名进程 {self.timeout} 秒无响应')
+        if line is None:
+            raise SignerCrashed('签名进程已退出')
+        res = json.loads(line)
+        if res.get('id') != req_id:
+            raise SignerCrashed(f'签名进程响应错位: {res.get("id")} != {req_id}')
+        if 'error' in res:
+            raise SignerError(res['error'])
+        return res['result']
+
+
+class NodeSigner(object):
+    """
+    常驻node进程池，进程崩溃或超时时自动重启后重试
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, js_path=DOUYIN_JS, node=None, timeout=10, max_restarts=2):
+        node = node or shutil.which('node')
+        if not node:
+            raise SignerError('未找到node运行时')
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.workers = [NodeWorker(js_path, node, timeout) for _ in range(max(1, workers))]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def call(self, name, *args):
+        return self.supervise(lambda worker: worker.call(name, *args))
+
+    def call_many(self, calls):
+        if not calls:
+            return []
+        return self.supervise(lambda worker: worker.call_many(calls))
+
+    def supervise(self, func):
+        """
+        取一个空闲进程执行func，进程崩溃时重启后重试
+        """
+        worker = self.idle.get()
+        try:
+            for attempt in range(self.max_restarts + 1):
+                try:
+                    if not worker.alive():
+                        if worker.proc is not None:
+                            logger.warning(f'签名进程已退出, 正在重启, pid: {worker.proc.pid}')
+                            self.restarts += 1
+                        worker.start()
+                    return func(worker)
+                except SignerCrashed as e:
+                    logger.warning(f'签名进程异常, 第{attempt + 1}次重启: {e}')
+                    worker.stop()
+                    self.restarts += 1
+            raise SignerError(f'签名进程连续重启{self.max_restarts}次仍失败')
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+BACKENDS = {
+    'native': NativeSigner,
+    'node': NodeSigner,
+    'execjs': ExecjsSigner,
+}
+_signers = {}
+_lock = threading.Lock()
+
+
+def get_signer(backend: str = ''):
+    """
+    按后端名返回进程内共享的签名器，node不可用时回退到execjs
+    """
+    backend = backend or DEFAULT_BACKEND
+    with _lock:
+        if backend not in _signers:
+            if backend not in BACKENDS:
+                raise SignerError(f'未知的签名后端: {backend}, 可选: {", ".join(BACKENDS)}')
+            try:
+                _signers[backend] = BACKENDS[backend]()
+            except SignerError as e:
+                logger.warning(f'签名后端 {backend} 不可用({e}), 回退到execjs')
+                _signers[backend] = ExecjsSigner()
+        return _signers[backend]
+
+
+@atexit.register
+def close_signers():
+    for signer in set(_signers.values()):
+        signer.close()
+    _signers.clear()
+
+
+def benchmark(backend: str, batch_sizes=(1, 10, 50, 200), total=400) -> dict:
+    """
+    按不同批大小测签名吞吐量(次/秒)
+    """
+    ua = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+    query = '&'.join(f'key{i}=value{i}' for i in range(40))
+    signer = get_signer(backend)
+    signer.call('sign_datail', query, ua)  # 预热
+    result = {}
+    for size in batch_sizes:
+        rounds = max(1, total // size)
+        calls = [('sign_datail', f'{query}&max_cursor={i}', ua) for i in range(size)]
+        start = time.perf_counter()
+        for _ in range(rounds):
+            signer.call_many(calls)
+        result[size] = round(rounds * size / (time.perf_counter() - start))
+    return result
+
+
+if __name__ == "__main__":
+    # python douyin_signer.py [后端...]
+    import sys
+    for backend in sys.argv[1:] or list(BACKENDS):
+        total = 20 if backend == 'execjs' else 400
+        logger.info(f'{backend}: {benchmark(backend, total=total)} (批大小: 次/秒)')
@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_singleflight.py
+@Desc    :   相同key的并发请求只执行一次，其他调用方等待并共享结果
+'''
+import asyncio
+import copy
+import json
+import threading
+import weakref
+
+
+def make_key(*parts) -> str:
+    """
+    把uri、参数等组合成稳定的key，dict按键排序
+    """
+    return json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    同一时刻相同key只有一个调用真正执行，执行期间到达的调用等待并拿到同一个结果(或同一个异常)
+    等待者拿到的是结果的浅拷贝，修改顶层字段或属性不会影响其他调用方；执行结束后key即被移除，不做缓存
+    """
+
+    def __init__(self, name: str = ''):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.async_calls = weakref.WeakKeyDictionary()  # 事件循环 -> {key: future}，循环被回收时随之移除
+        self.total = 0  # 调用次数
+        self.executed = 0  # 实际执行次数
+
+    @property
+    def coalesced(self) -> int:
+        return self.total - self.executed
+
+    def do(self, key, func):
+        with self.lock:
+            self.total += 1
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.copy(call.result)
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    async def do_async(self, key, func):
+        """
+        协程版本，func返回awaitable；key在每个事件循环内独立
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            calls = self.async_calls.setdefault(loop, {})
+            self.total += 1
+            future = calls.get(key)
+            if future is None:
+                self.executed += 1
+        if future is not None:
+            try:
+                return copy.copy(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 执行者被取消(例如对冲请求中落败的一方)，由当前调用方重新执行
+                return await self.do_async(key, func)
+        future = calls[key] = loop.create_future()
+        try:
+            result = await func()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免"exception was never retrieved"警告
+            future.exception()
+            raise
+        finally:
+            calls.pop(key, None)
+
+    def stats(self) -> dict:
+        return {'calls': self.total, 'executed': self.executed, 'coalesced': self.coalesced}
+
+
+_groups = {}
+_lock = threading.Lock()
+
+
+def group(name: str) -> SingleFlight:
+    with _lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def stats() -> dict:
+    """
+    各分组的调用次数、实际执行次数和被合并的次数
+    """
+    return {name: g.stats() for name, g in _groups.items()}
@@ -1,8 +1,10 @@
 import os
-import requests
 import ujson as json
 from loguru import logger
 
+import douyin_http
+import douyin_singleflight
+
 
 def str_to_path(str: str):
     """
@@ -32,7 +34,12 @@ def quit(str: str = ''):
 
 
 def url_redirect(url):
-    r = requests.head(url, allow_redirects=False)
+    # 同一短链接并发解析时只发一次请求
+    return douyin_singleflight.group('url_redirect').do(url, lambda: _url_redirect(url))
+
+
+def _url_redirect(url):
+    r = douyin_http.head(url, allow_redirects=False)
     u = r.headers.get('Location', url)
     return u
 
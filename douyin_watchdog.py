@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_watchdog.py
+@Desc    :   阶段看门狗：每个阶段在独立线程中执行，超过时限没有进展时放弃等待，由调用方重排或跳过
+'''
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from loguru import logger
+
+# 各阶段允许的最长无进展时间(秒)，可通过环境变量DOUYIN_STALL_TIMEOUTS覆盖，例如"ai_talk=300,cookie=90"
+STALL_TIMEOUTS = {
+    'cookie': 180.0,
+    'user_info': 90.0,
+    'ai_talk': 240.0,
+}
+DEFAULT_STALL_TIMEOUT = 120.0
+POLL_INTERVAL = 0.5
+# 卡住的任务最多重排几次
+MAX_REQUEUE = int(os.environ.get('DOUYIN_MAX_REQUEUE', '1'))
+
+
+def _parse_env(value: str) -> dict:
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, seconds = item.partition('=')
+        timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+STALL_TIMEOUTS.update(_parse_env(os.environ.get('DOUYIN_STALL_TIMEOUTS', '')))
+
+_local = threading.local()
+
+
+class StageStalled(TimeoutError):
+    """阶段在时限内没有进展"""
+
+    def __init__(self, stage: str, idle: float):
+        super().__init__(f'阶段 {stage} 已 {idle:.1f} 秒没有进展')
+        self.stage = stage
+        self.idle = idle
+
+
+class _Task(object):
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.started = time.monotonic()
+        self.last_beat = self.started
+        self.cancelled = False
+
+
+def beat():
+    """
+    报告当前阶段有进展(完成一次请求、收到一个流式事件等)，不在看门狗线程中调用时无效果
+    所在阶段已被放弃时抛出StageStalled，让卡住的线程在恢复后尽快退出
+    """
+    task = getattr(_local, 'task', None)
+    if task is None:
+        return
+    if task.cancelled:
+        raise StageStalled(task.stage, time.monotonic() - task.last_beat)
+    task.last_beat = time.monotonic()
+
+
+class Watchdog(object):
+    """
+    run(stage, func, ...)在后台线程执行func，调用线程每POLL_INTERVAL秒检查一次，
+    距离最近一次beat()超过该阶段时限时标记取消并抛出StageStalled
+    线程无法被强制终止，卡住的线程会在下一次beat()时退出，其结果被丢弃
+    """
+
+    def __init__(self, timeouts: dict = None):
+        self.timeouts = dict(STALL_TIMEOUTS, **(timeouts or {}))
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, stage: str, key: str):
+        with self.lock:
+            counts = self.counts.setdefault(stage, {'runs': 0, 'timeouts': 0, 'requeued': 0})
+            counts[key] += 1
+
+    def requeued(self, stage: str):
+        self.count(stage, 'requeued')
+
+    def run(self, stage: str, func, *args, **kwargs):
+        timeout = self.timeouts.get(stage, DEFAULT_STALL_TIMEOUT)
+        task = _Task(stage)
+        future = Future()
+
+        def target():
+            _local.task = task
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                _local.task = None
+
+        self.count(stage, 'runs')
+        threading.Thread(target=target, name=f'watchdog-{stage}', daemon=True).start()
+        while True:
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except FutureTimeout:
+                idle = time.monotonic() - task.last_beat
+                if idle > timeout:
+                    task.cancelled = True
+                    self.count(stage, 'timeouts')
+                    logger.warning(f'阶段 {stage} 已 {idle:.1f} 秒没有进展(时限 {timeout} 秒)，放弃等待')
+                    raise StageStalled(stage, idle)
+
+    def stats(self) -> dict:
+        """
+        各阶段的执行次数、超时次数和重排次数
+        """
+        with self.lock:
+            return {stage: dict(counts) for stage, counts in self.counts.items()}
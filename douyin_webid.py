@@ -0,0 +1,154 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    :   douyin_webid.py
+@Desc    :   webid流式提取与磁盘缓存，缓存按cookie身份区分，多个Request实例和多次运行共享
+'''
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from loguru import logger
+
+CACHE_FILE = os.environ.get('DOUYIN_WEBID_CACHE', 'config/webid.json')
+TTL = int(os.environ.get('DOUYIN_WEBID_TTL', str(24 * 3600)))  # 秒
+# 只用标识设备/账号的cookie计算指纹，msToken等每次都会变的值不参与
+IDENTITY_COOKIES = ('ttwid', 's_v_web_id', 'sessionid', 'sessionid_ss', 'uid_tt', 'odin_tt')
+
+WEBID_URL = 'https://www.douyin.com/?recommend=1'
+WEBID_PATTERN = rb'\\"user_unique_id\\":\\"(\d+)\\"'
+CHUNK_SIZE = 16 * 1024
+
+
+class StreamSearcher(object):
+    """
+    分块匹配正则：每块与上一块末尾的overlap字节拼接后再搜索，跨块的匹配也能找到
+    找到后调用方即可关闭连接，不必下载整个页面
+    """
+
+    def __init__(self, pattern: bytes = WEBID_PATTERN, overlap: int = 256):
+        self.regex = re.compile(pattern)
+        self.overlap = overlap
+        self.tail = b''
+        self.size = 0  # 已读取的字节数
+
+    def feed(self, chunk: bytes) -> str:
+        self.size += len(chunk)
+        buffer = self.tail + chunk
+        match = self.regex.search(buffer)
+        if match:
+            return match.group(1).decode()
+        self.tail = buffer[-self.overlap:]
+        return ''
+
+    def search(self, chunks) -> str:
+        for chunk in chunks:
+            result = self.feed(chunk)
+            if result:
+                return result
+        return ''
+
+
+def cookie_fingerprint(cookies: dict, ua: str = '') -> str:
+    parts = [f'{k}={cookies[k]}' for k in IDENTITY_COOKIES if cookies.get(k)]
+    parts.append(ua)
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class WebidCache(object):
+    """
+    {指纹: {"webid": ..., "time": ...}}，写入时先写临时文件再os.replace，
+    并与磁盘上的最新内容合并，多个进程同时写不会互相覆盖成半个文件
+    """
+
+    def __init__(self, path: str = CACHE_FILE, ttl: int = TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def dump(self, data: dict):
+        path = os.path.dirname(self.path)
+        if path:
+            os.makedirs(path, exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def get(self, key: str) -> str:
+        entry = self.load().get(key)
+        if entry and time.time() - entry.get('time', 0) < self.ttl and entry.get('webid'):
+            self.hits += 1
+            return entry['webid']
+        self.misses += 1
+        return ''
+
+    def set(self, key: str, webid: str):
+        with self.lock:
+            data = self.load()
+            now = time.time()
+            # 顺便清理过期项
+            data = {k: v for k, v in data.items() if now - v.get('time', 0) < self.ttl}
+            data[key] = {'webid': webid, 'time': now}
+            self.dump(data)
+
+    def invalidate(self, key: str):
+        with self.lock:
+            data = self.load()
+            if data.pop(key, None) is not None:
+                self.dump(data)
+                logger.info(f'webid缓存已失效: {key}')
+
+
+_cache = None
+
+
+def get_cache() -> WebidCache:
+    global _cache
+    if _cache is None:
+        _cache = WebidCache()
+    return _cache
+
+
+def benchmark(url: str = WEBID_URL, cookie: str = '', rounds: int = 3):
+    """
+    对比整页下载+re.search与流式提取的读取字节数和耗时
+    """
+    try:
+        import douyin_http
+        from douyin_request import Request
+    except ImportError:
+        # 处理直接运行时的导入
+        import douyin_http
+        from douyin_request import Request
+    request = Request(cookie)
+    headers = request.PAGE_HEADERS
+    for _ in range(rounds):
+        start = time.perf_counter()
+        response = douyin_http.get(url, headers=headers, cookies=request.COOKIES)
+        match = re.search(WEBID_PATTERN.decode(), response.text)
+        logger.info(f'整页: {len(response.content)} 字节, {time.perf_counter() - start:.3f}s, webid: {match and match.group(1)}')
+
+        start = time.perf_counter()
+        searcher = StreamSearcher()
+        with douyin_http.get(url, headers=headers, cookies=request.COOKIES, stream=True) as response:
+            webid = searcher.search(response.iter_content(CHUNK_SIZE))
+        logger.info(f'流式: {searcher.size} 字节, {time.perf_counter() - start:.3f}s, webid: {webid}')
+
+
+if __name__ == "__main__":
+    # python douyin_webid.py [url]
+    import sys
+    benchmark(*sys.argv[1:2])
@@ -14,16 +14,28 @@ import os
 import re
 import sys
 import time
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Optional, Union
 
 # 导入Cookie配置管理器
 try:
-    from batch_config_cookie import BatchDouyinCookieManager
+    from batch_config_cookie import BatchDouyinCookieManager, CookieLifecycle
 except ImportError:
     print("❌ 无法导入 batch_config_cookie 模块，请确保文件存在")
     sys.exit(1)
 
+# 导入限速器、客户端注册表和看门狗
+try:
+    import douyin_clients
+    import douyin_config_cache
+    import douyin_dns
+    import douyin_ratelimit
+    import douyin_watchdog
+except ImportError:
+    print("❌ 无法导入 douyin_ratelimit/douyin_clients/douyin_watchdog 模块，请确保文件存在")
+    sys.exit(1)
+
 # 导入douyin-4的用户信息获取模块
 try:
     # 添加douyin-4的lib目录到系统路径
@@ -55,6 +67,12 @@ class IntegratedDouyinCrawler:
     def __init__(self):
         # 初始化Cookie配置管理器
         self.cookie_manager = BatchDouyinCookieManager()
+        # Cookie只获取一次，失效或临近过期时才重新获取
+        self.cookie_lifecycle = CookieLifecycle(self.cookie_manager)
+        # 后台在登录检查结果过期或登录临近失效前重新检查
+        self.cookie_lifecycle.start_refresher()
+        # 长时间运行，监听配置文件变化(不可用时按文件签名判断)
+        douyin_config_cache.start_watcher()
         
         # 配置文件路径
         self.urls_config_file = os.path.join(os.path.dirname(__file__), "urls_config.txt")
@@ -64,6 +82,9 @@ class IntegratedDouyinCrawler:
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
         
+        # 每个阶段在看门狗下执行，卡住的链接放到队尾重试
+        self.watchdog = douyin_watchdog.Watchdog()
+        
         # 处理统计
         self.stats = {
             "total_urls": 0,
@@ -73,6 +94,8 @@ class IntegratedDouyinCrawler:
             "crawl_failed": 0,
             "start_time": None,
             "end_time": None,
+            "warmup": None,
+            "first_result_seconds": None,
             "results": []
         }
         
@@ -136,51 +159,37 @@ class IntegratedDouyinCrawler:
         self.log(f"[{index}/{total}] 开始为链接配置Cookie: {url}")
         
         try:
-            # 使用Cookie管理器的单个URL处理方法
-            result = self.cookie_manager.process_single_url(url, index, total)
+            # 已有有效Cookie时直接复用，不再读取浏览器
+            result = self.cookie_lifecycle.ensure(url, index, total)
             
             if result["success"]:
-                self.log(f"[{index}/{total}] ✅ Cookie配置成功")
-                self.stats["cookie_success"] += 1
+                self.log(f"[{index}/{total}] ✅ {'复用已配置的Cookie' if result.get('cached') else 'Cookie配置成功'}")
                 return True
             else:
                 self.log(f"[{index}/{total}] ❌ Cookie配置失败: {result['message']}", "ERROR")
-                self.stats["cookie_failed"] += 1
                 return False
                 
         except Exception as e:
             self.log(f"[{index}/{total}] ❌ Cookie配置异常: {e}", "ERROR")
-            self.stats["cookie_failed"] += 1
             return False
     
     def load_cookie_from_config(self):
-        """从配置文件加载Cookie字符串"""
-        cookie_config_file = self.cookie_manager.cookie_config_file
+        """从配置文件加载Cookie字符串(经过配置缓存，文件没有变化时不重新读取)"""
+        store = self.cookie_manager.cookie_store
         
-        if not os.path.exists(cookie_config_file):
-            self.log(f"Cookie配置文件不存在: {cookie_config_file}", "ERROR")
+        if not os.path.exists(store.path) and not os.path.exists(store.legacy_text):
+            self.log(f"Cookie配置文件不存在: {store.path}", "ERROR")
             return None
         
         try:
-            with open(cookie_config_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            config = douyin_config_cache.read_cookie_store(store)
             
-            for line in lines:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                
-                # 解析cookie配置
-                if line.startswith('cookie='):
-                    cookie = line[7:].strip()  # 移除'cookie='前缀
-                    if cookie and cookie != "your_cookie_string_here":
-                        self.log("✅ 从配置文件读取到有效Cookie")
-                        return cookie
-                
-                elif line.startswith('browser='):
-                    browser = line[8:].strip()  # 移除'browser='前缀
-                    if browser in ['chrome', 'edge']:
-                        self.log(f"⚠️ 发现浏览器配置，但需要具体的Cookie字符串: {browser}")
+            if config["cookie"]:
+                self.log("✅ 从配置文件读取到有效Cookie")
+                return config["cookie"]
+            
+            if config["browser"] in ['chrome', 'edge']:
+                self.log(f"⚠️ 发现浏览器配置，但需要具体的Cookie字符串: {config['browser']}")
             
             self.log("❌ 配置文件中未找到有效的Cookie字符串", "ERROR")
             return None
@@ -194,14 +203,14 @@ class IntegratedDouyinCrawler:
         self.log(f"[{index}/{total}] 开始抓取用户信息: {url}")
         
         try:
-            # 获取当前Cookie
-            cookie = self.load_cookie_from_config()
+            # 获取当前Cookie，优先使用内存中的
+            cookie = self.cookie_lifecycle.cookie or self.load_cookie_from_config()
             if not cookie:
                 self.log(f"[{index}/{total}] ❌ 无法获取有效Cookie，跳过抓取", "ERROR")
                 return None
             
-            # 初始化或重新初始化用户信息获取器
-            self.user_getter = DouyinUserInfo(cookie)
+            # 同一cookie复用同一个用户信息获取器，cookie变化时注册表自动重建
+            self.user_getter = douyin_clients.get_client(cookie, DouyinUserInfo)
             
             # 获取用户信息
             user_info = self.user_getter.get_user_info_from_url(url)
@@ -212,17 +221,13 @@ class IntegratedDouyinCrawler:
                 self.log(f"[{index}/{total}]    📝 签名: {user_info.get('signature', '无')}")
                 self.log(f"[{index}/{total}]    🌍 地区: {user_info.get('ip_location', '未知')}")
                 self.log(f"[{index}/{total}]    👥 粉丝: {user_info.get('follower_count', 0)}")
-                
-                self.stats["crawl_success"] += 1
                 return user_info
             else:
                 self.log(f"[{index}/{total}] ❌ 用户信息获取失败", "ERROR")
-                self.stats["crawl_failed"] += 1
                 return None
                 
         except Exception as e:
             self.log(f"[{index}/{total}] ❌ 抓取用户信息异常: {e}", "ERROR")
-            self.stats["crawl_failed"] += 1
             return None
     
     def save_user_info(self, user_info: Dict, url: str, index: int) -> Optional[str]:
@@ -278,7 +283,10 @@ class IntegratedDouyinCrawler:
         
         # 第一步：配置Cookie
         self.log(f"[{index}/{total}] 步骤1: 配置Cookie")
-        cookie_success = self.configure_cookie_for_url(url, index, total)
+        try:
+            cookie_success = self.watchdog.run('cookie', self.configure_cookie_for_url, url, index, total)
+        except douyin_watchdog.StageStalled as e:
+            return self.stalled_result(result, e, index, total)
         result["cookie_success"] = cookie_success
         
         if not cookie_success:
@@ -286,13 +294,12 @@ class IntegratedDouyinCrawler:
             self.log(f"[{index}/{total}] ❌ 由于Cookie配置失败，跳过用户信息抓取")
             return result
         
-        # 添加延迟，确保Cookie配置生效
-        self.log(f"[{index}/{total}] 等待2秒，确保Cookie配置生效...")
-        time.sleep(2)
-        
         # 第二步：抓取用户信息
         self.log(f"[{index}/{total}] 步骤2: 抓取用户信息")
-        user_info = self.crawl_user_info(url, index, total)
+        try:
+            user_info = self.watchdog.run('user_info', self.crawl_user_info, url, index, total)
+        except douyin_watchdog.StageStalled as e:
+            return self.stalled_result(result, e, index, total)
         
         if user_info:
             result["crawl_success"] = True
@@ -311,12 +318,37 @@ class IntegratedDouyinCrawler:
         else:
             result["error_message"] = "用户信息抓取失败"
             self.log(f"[{index}/{total}] ❌ 用户信息抓取失败")
+            # Cookie失效导致的失败：丢弃Cookie，由主循环重排后重新获取
+            if self.user_getter is not None and self.cookie_lifecycle.report_failure(self.user_getter):
+                result["auth_failed"] = True
         
         return result
     
+    def stalled_result(self, result: Dict, error: Exception, index: int, total: int) -> Dict:
+        """阶段超时时的处理结果，由主循环决定是否重排"""
+        result["error_message"] = f"阶段超时: {error}"
+        result["stalled_stage"] = error.stage
+        self.log(f"[{index}/{total}] ⏱️ {error}", "WARNING")
+        return result
+    
+    def tally(self, result: Dict):
+        """
+        按链接的最终结果统计一次；各阶段函数不修改统计，重排的链接和被看门狗放弃的线程不会重复计数
+        """
+        self.stats["results"].append(result)
+        if not result["cookie_success"]:
+            self.stats["cookie_failed"] += 1
+            return
+        self.stats["cookie_success"] += 1
+        if result["crawl_success"]:
+            self.stats["crawl_success"] += 1
+        else:
+            self.stats["crawl_failed"] += 1
+    
     def run_integrated_crawl(self, delay_seconds: int = 5) -> bool:
         """运行整合爬虫的主流程"""
         self.log("=== 抖音用户信息整合抓取工具启动 ===")
+        run_started = time.monotonic()
         
         # 读取URLs
         urls = self.read_urls_config()
@@ -330,15 +362,34 @@ class IntegratedDouyinCrawler:
         
         self.log(f"准备按顺序处理 {len(urls)} 个链接")
         
-        # 顺序处理每个URL
-        for index, url in enumerate(urls, 1):
+        # DNS缓存与预热分开控制：DOUYIN_DNS_CACHE=0关闭缓存，DOUYIN_WARMUP=0只跳过预热，用于对比首个结果的耗时
+        if douyin_dns.CACHE:
+            douyin_dns.install()
+        # 并行解析并预连接本次会访问的域名
+        if douyin_dns.WARMUP:
+            hosts = tuple(dict.fromkeys(douyin_dns.WARM_HOSTS + douyin_dns.url_hosts(urls)))
+            self.stats["warmup"] = douyin_dns.warmup(hosts)
+        
+        # delay_seconds为相邻链接开始处理的最小间隔，处理耗时已超过间隔时不再额外等待
+        if delay_seconds > 0:
+            douyin_ratelimit.configure('url', 1 / delay_seconds)
+        
+        # 顺序处理每个URL，某个阶段卡住的链接放到队尾重试
+        queue = deque((index, url, 0) for index, url in enumerate(urls, 1))
+        while queue:
+            index, url, attempts = queue.popleft()
+            if delay_seconds > 0:
+                douyin_ratelimit.acquire('url')
             result = self.process_single_url(url, index, len(urls))
-            self.stats["results"].append(result)
-            
-            # 如果不是最后一个URL，添加延迟
-            if index < len(urls):
-                self.log(f"等待 {delay_seconds} 秒后处理下一个链接...")
-                time.sleep(delay_seconds)
+            if (result.get("stalled_stage") or result.get("auth_failed")) and attempts < douyin_watchdog.MAX_REQUEUE:
+                if result.get("stalled_stage"):
+                    self.watchdog.requeued(result["stalled_stage"])
+                self.log(f"[{index}/{len(urls)}] 链接放到队尾重试")
+                queue.append((index, url, attempts + 1))
+                continue
+            self.tally(result)
+            if result["crawl_success"] and self.stats["first_result_seconds"] is None:
+                self.stats["first_result_seconds"] = round(time.monotonic() - run_started, 3)
         
         # 完成处理
         self.stats["end_time"] = datetime.now().isoformat()
@@ -367,6 +418,11 @@ class IntegratedDouyinCrawler:
         self.log(f"用户信息抓取成功: {stats['crawl_success']} ✅")
         self.log(f"用户信息抓取失败: {stats['crawl_failed']} ❌")
         self.log(f"总处理时长: {duration:.2f} 秒")
+        if stats["first_result_seconds"] is not None:
+            self.log(f"启动到首个结果: {stats['first_result_seconds']:.2f} 秒 (预热: {'开' if stats['warmup'] else '关'})")
+        self.log(f"Cookie获取 {self.cookie_lifecycle.stats['acquired']} 次, 复用 {self.cookie_lifecycle.stats['reused']} 次, 失效 {self.cookie_lifecycle.stats['invalidated']} 次")
+        for stage, counts in self.watchdog.stats().items():
+            self.log(f"阶段 {stage}: 执行 {counts['runs']} 次, 超时 {counts['timeouts']} 次, 重排 {counts['requeued']} 次")
         
         if stats["total_urls"] > 0:
             cookie_rate = (stats["cookie_success"] / stats["total_urls"] * 100)
@@ -403,7 +459,11 @@ class IntegratedDouyinCrawler:
                 'crawl_failed': stats['crawl_failed'],
                 'processing_time_seconds': round(duration, 2),
                 'start_time': stats['start_time'],
-                'end_time': stats['end_time']
+                'end_time': stats['end_time'],
+                'warmup': stats['warmup'],
+                'first_result_seconds': stats['first_result_seconds'],
+                'stages': self.watchdog.stats(),
+                'cookie_lifecycle': self.cookie_lifecycle.stats
             },
             'results': stats['results']
         }
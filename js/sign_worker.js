@@ -0,0 +1,56 @@
+// 常驻签名进程：加载 douyin.js 后按行读取 JSON 请求，调用其中的签名函数并按行返回结果
+// 请求：{"id": 1, "fn": "sign_datail", "args": ["query", "ua"]}
+// 响应：{"id": 1, "result": "..."} 或 {"id": 1, "error": "..."}
+// 批量请求：{"id": 2, "batch": [{"fn": ..., "args": [...]}, ...]}，result为按序的结果数组
+// 可选字段 now / random 为数组时，本次调用中 Date.now / Math.random 依次返回其中的值(一致性校验用)
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+const vm = require('vm');
+
+const source = path.resolve(process.argv[2] || path.join(__dirname, 'douyin.js'));
+vm.runInThisContext(fs.readFileSync(source, 'utf-8'), {filename: source});
+
+const realNow = Date.now;
+const realRandom = Math.random;
+
+function replay(values, fallback) {
+    let i = 0;
+    return () => (i < values.length ? values[i++] : fallback());
+}
+
+function handle(req) {
+    const fn = globalThis[req.fn];
+    if (typeof fn !== 'function') {
+        throw new Error('unknown function: ' + req.fn);
+    }
+    if (Array.isArray(req.now)) {
+        Date.now = replay(req.now, realNow);
+    }
+    if (Array.isArray(req.random)) {
+        Math.random = replay(req.random, realRandom);
+    }
+    try {
+        return fn.apply(null, req.args || []);
+    } finally {
+        Date.now = realNow;
+        Math.random = realRandom;
+    }
+}
+
+const rl = readline.createInterface({input: process.stdin, terminal: false});
+rl.on('line', (line) => {
+    if (!line.trim()) {
+        return;
+    }
+    let req = null;
+    let res;
+    try {
+        req = JSON.parse(line);
+        res = {id: req.id, result: Array.isArray(req.batch) ? req.batch.map(handle) : handle(req)};
+    } catch (e) {
+        res = {id: req ? req.id : null, error: String((e && e.stack) || e)};
+    }
+    process.stdout.write(JSON.stringify(res) + '\n');
+});
+rl.on('close', () => process.exit(0));
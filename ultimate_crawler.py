@@ -11,8 +11,10 @@ import os
 import re
 import sys
 import time
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Optional, Union
+from urllib.parse import urlsplit
 
 # Coze SDK导入
 try:
@@ -21,9 +23,22 @@ except ImportError:
     print("❌ 请先安装 cozepy 库: pip install cozepy")
     exit(1)
 
+# 导入限速器、录制回放模块、客户端注册表和看门狗
+try:
+    import douyin_cassette
+    import douyin_clients
+    import douyin_config_cache
+    import douyin_dns
+    import douyin_http
+    import douyin_ratelimit
+    import douyin_watchdog
+except ImportError:
+    print("❌ 无法导入 douyin_ratelimit/douyin_cassette/douyin_clients/douyin_watchdog 模块，请确保文件存在")
+    exit(1)
+
 # 导入Cookie配置管理器
 try:
-    from batch_config_cookie import BatchDouyinCookieManager
+    from batch_config_cookie import BatchDouyinCookieManager, CookieLifecycle
 except ImportError:
     print("❌ 无法导入 batch_config_cookie 模块，请确保文件存在")
     sys.exit(1)
@@ -59,12 +74,12 @@ class UltimateCrawler:
         # 初始化Coze客户端
         self.coze = Coze(
             auth=TokenAuth(token=self.coze_api_token), 
-            base_url=COZE_CN_BASE_URL
+            base_url=COZE_CN_BASE_URL,
+            http_client=douyin_http.coze_http_client()
         )
         
         # 文件和目录配置
         self.urls_config_file = "urls_config.txt"
-        self.cookie_config_file = os.path.join("config", "cookie_config.txt")
         self.user_output_dir = "integrated_output"
         self.talk_output_dir = "Talk_output"
         self.log_file = "ultimate_crawler_log.txt"
@@ -76,6 +91,16 @@ class UltimateCrawler:
         
         # 初始化Cookie管理器
         self.cookie_manager = BatchDouyinCookieManager()
+        # Cookie只获取一次，失效或临近过期时才重新获取
+        self.cookie_lifecycle = CookieLifecycle(self.cookie_manager)
+        # 后台在登录检查结果过期或登录临近失效前重新检查
+        self.cookie_lifecycle.start_refresher()
+        self.user_getter = None
+        # 长时间运行，监听配置文件变化(不可用时按文件签名判断)
+        douyin_config_cache.start_watcher()
+        
+        # 每个阶段在看门狗下执行，卡住的链接放到队尾重试
+        self.watchdog = douyin_watchdog.Watchdog()
         
         # 统计信息
         self.stats = {
@@ -87,6 +112,8 @@ class UltimateCrawler:
             "ai_success": 0,
             "start_time": None,
             "end_time": None,
+            "warmup": None,
+            "first_result_seconds": None,
             "results": []
         }
     
@@ -135,11 +162,11 @@ class UltimateCrawler:
         try:
             self.log(f"开始配置Cookie: {url}")
             
-            # 使用Cookie管理器配置单个URL
-            success = self.cookie_manager.process_single_url(url, index, self.stats["total_urls"])
+            # 已有有效Cookie时直接复用，不再读取浏览器
+            result = self.cookie_lifecycle.ensure(url, index, self.stats["total_urls"])
             
-            if success:
-                self.log("✅ Cookie配置成功")
+            if result["success"]:
+                self.log("✅ 复用已配置的Cookie" if result.get("cached") else "✅ Cookie配置成功")
                 return True
             else:
                 self.log("❌ Cookie配置失败", "WARNING")
@@ -150,18 +177,16 @@ class UltimateCrawler:
             return False
     
     def load_cookie_from_config(self) -> Optional[str]:
-        """从配置文件加载Cookie"""
+        """从配置文件加载Cookie(经过配置缓存，文件没有变化时不重新读取)"""
         try:
-            if not os.path.exists(self.cookie_config_file):
+            store = self.cookie_manager.cookie_store
+            if not os.path.exists(store.path) and not os.path.exists(store.legacy_text):
                 self.log("Cookie配置文件不存在", "ERROR")
                 return None
             
-            with open(self.cookie_config_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('cookie='):
-                        cookie = line[7:]  # 移除 'cookie=' 前缀
-                        return cookie
+            cookie = douyin_config_cache.get_config_cookie(store)
+            if cookie:
+                return cookie
             
             self.log("在配置文件中未找到cookie配置", "ERROR")
             return None
@@ -175,14 +200,14 @@ class UltimateCrawler:
         try:
             self.log(f"开始提取用户信息: {url}")
             
-            # 加载Cookie
-            cookie_str = self.load_cookie_from_config()
+            # 优先使用内存中的Cookie
+            cookie_str = self.cookie_lifecycle.cookie or self.load_cookie_from_config()
             if not cookie_str:
                 self.log("无法获取Cookie，跳过用户信息提取", "ERROR")
                 return None
             
-            # 创建用户信息提取器
-            user_info_getter = DouyinUserInfo(cookie_str)
+            # 获取共享的用户信息提取器，同一cookie不再为每个URL重新构造
+            user_info_getter = self.user_getter = douyin_clients.get_client(cookie_str, DouyinUserInfo)
             
             # 提取用户信息
             user_info = user_info_getter.get_user_info_from_url(url)
@@ -259,6 +284,32 @@ class UltimateCrawler:
                 
         return cleaned_info
     
+    def stream_chat(self, prompt: str) -> str:
+        """流式调用Coze对话，返回拼接后的回复"""
+        # 调用频率由限速器的coze配额控制
+        douyin_ratelimit.acquire('coze')
+        talk_content = ""
+        # 两个事件之间的间隔受httpx读取超时限制，整个对话另有总时限
+        deadline = time.monotonic() + douyin_http.COZE_TOTAL_TIMEOUT
+        for event in self.coze.chat.stream(
+            bot_id=self.bot_id,
+            user_id=self.user_id,
+            additional_messages=[
+                Message.build_user_question_text(prompt),
+            ],
+        ):
+            douyin_watchdog.beat()
+            if time.monotonic() > deadline:
+                raise douyin_http.DeadlineExceeded(f"Coze对话超过总时限 {douyin_http.COZE_TOTAL_TIMEOUT} 秒")
+            
+            if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
+                talk_content += event.message.content
+            
+            if event.event == ChatEventType.CONVERSATION_CHAT_COMPLETED:
+                self.log(f"API调用完成，token使用量: {event.chat.usage.token_count if event.chat.usage else '未知'}")
+                break
+        return talk_content
+    
     def generate_ai_talk(self, user_info: Dict, index: int, url: str) -> Optional[str]:
         """生成AI话术"""
         try:
@@ -287,22 +338,10 @@ class UltimateCrawler:
                 self.log(f"❌ JSON验证失败: {e}", "ERROR")
                 return None
             
-            # 调用Coze API
-            talk_content = ""
-            
-            for event in self.coze.chat.stream(
-                bot_id=self.bot_id,
-                user_id=self.user_id,
-                additional_messages=[
-                    Message.build_user_question_text(json_input),
-                ],
-            ):
-                if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
-                    talk_content += event.message.content
-                
-                if event.event == ChatEventType.CONVERSATION_CHAT_COMPLETED:
-                    self.log(f"API调用完成，token使用量: {event.chat.usage.token_count if event.chat.usage else '未知'}")
-                    break
+            # 调用Coze API，录制/回放模式下经过douyin_cassette(json_input含抓取时间，按链接匹配录制)
+            talk_content = douyin_cassette.get_cassette().call(
+                'coze', {'bot_id': self.bot_id, 'source_url': url}, lambda: self.stream_chat(json_input))
+            douyin_ratelimit.feedback('coze', True)
             
             # 清理生成的内容
             talk_content = talk_content.strip()
@@ -319,6 +358,7 @@ class UltimateCrawler:
                 
         except Exception as e:
             self.log(f"AI话术生成失败: {e}", "ERROR")
+            douyin_ratelimit.feedback('coze', False)
             return None
     
     def save_ai_talk(self, talk_content: str, user_info: Dict, index: int):
@@ -370,7 +410,7 @@ class UltimateCrawler:
             
             # 步骤1: 配置Cookie
             self.log(f"[{index}/{self.stats['total_urls']}] 步骤1: 配置Cookie")
-            cookie_success = self.configure_cookie_for_url(url, index)
+            cookie_success = self.watchdog.run('cookie', self.configure_cookie_for_url, url, index)
             result["cookie_success"] = cookie_success
             
             if not cookie_success:
@@ -378,35 +418,28 @@ class UltimateCrawler:
                 self.log(f"[{index}/{self.stats['total_urls']}] ❌ Cookie配置失败，跳过后续步骤")
                 return result
             
-            self.stats["cookie_success"] += 1
-            
-            # 延迟避免请求过频
-            time.sleep(3)
-            
             # 步骤2: 提取用户信息
             self.log(f"[{index}/{self.stats['total_urls']}] 步骤2: 提取用户信息")
-            user_info = self.extract_user_info(url, index)
+            user_info = self.watchdog.run('user_info', self.extract_user_info, url, index)
             result["user_info"] = user_info
             
             if not user_info:
                 result["error_message"] = "用户信息提取失败"
+                # Cookie失效导致的失败：丢弃Cookie，由主循环重排后重新获取
+                if self.user_getter is not None and self.cookie_lifecycle.report_failure(self.user_getter):
+                    result["auth_failed"] = True
                 self.log(f"[{index}/{self.stats['total_urls']}] ❌ 用户信息提取失败，跳过AI话术生成")
                 return result
             
             result["crawl_success"] = True
-            self.stats["crawl_success"] += 1
-            
-            # 延迟避免API调用过频
-            time.sleep(2)
             
             # 步骤3: 生成AI话术
             self.log(f"[{index}/{self.stats['total_urls']}] 步骤3: 生成AI话术")
-            ai_talk = self.generate_ai_talk(user_info, index, url)
+            ai_talk = self.watchdog.run('ai_talk', self.generate_ai_talk, user_info, index, url)
             result["ai_talk"] = ai_talk
             
             if ai_talk:
                 result["ai_success"] = True
-                self.stats["ai_success"] += 1
                 self.log(f"[{index}/{self.stats['total_urls']}] ✅ 完整流程成功完成")
             else:
                 result["error_message"] = "AI话术生成失败"
@@ -414,14 +447,33 @@ class UltimateCrawler:
             
             return result
             
+        except douyin_watchdog.StageStalled as e:
+            result["error_message"] = f"阶段超时: {e}"
+            result["stalled_stage"] = e.stage
+            self.log(f"[{index}/{self.stats['total_urls']}] ⏱️ {e}", "WARNING")
+            return result
         except Exception as e:
             result["error_message"] = f"处理异常: {str(e)}"
             self.log(f"[{index}/{self.stats['total_urls']}] ❌ 处理异常: {e}", "ERROR")
             return result
     
+    def tally(self, result: Dict):
+        """
+        按链接的最终结果统计一次；各阶段函数不修改统计，重排的链接和被看门狗放弃的线程不会重复计数
+        """
+        self.stats["results"].append(result)
+        for key in ("cookie_success", "crawl_success", "ai_success"):
+            if result[key]:
+                self.stats[key] += 1
+        if result["ai_success"]:
+            self.stats["success_count"] += 1
+        else:
+            self.stats["failed_count"] += 1
+    
     def process_all_urls(self) -> bool:
         """处理所有URL"""
         self.log("=== 抖音用户终极爬虫启动 ===")
+        run_started = time.monotonic()
         
         # 读取URL配置
         urls = self.read_urls_config()
@@ -435,22 +487,31 @@ class UltimateCrawler:
         
         self.log(f"找到 {len(urls)} 个待处理的URL")
         
-        # 逐个处理URL
-        for i, url in enumerate(urls, 1):
+        # DNS缓存与预热分开控制：DOUYIN_DNS_CACHE=0关闭缓存，DOUYIN_WARMUP=0只跳过预热，用于对比首个结果的耗时
+        if douyin_dns.CACHE:
+            douyin_dns.install()
+        # 并行解析并预连接本次会访问的域名(Coze只解析)
+        if douyin_dns.WARMUP:
+            hosts = tuple(dict.fromkeys(douyin_dns.WARM_HOSTS + douyin_dns.url_hosts(urls)))
+            self.stats["warmup"] = douyin_dns.warmup(hosts, resolve_hosts=(urlsplit(COZE_CN_BASE_URL).hostname,))
+        
+        # 逐个处理URL，某个阶段卡住的链接放到队尾重试
+        queue = deque((i, url, 0) for i, url in enumerate(urls, 1))
+        while queue:
+            i, url, attempts = queue.popleft()
             try:
+                # 按'url'配额控制链接间的节奏，处理耗时已超过间隔时不再额外等待
+                douyin_ratelimit.acquire('url')
                 result = self.process_single_url(url, i)
-                self.stats["results"].append(result)
-                
-                # 更新成功计数
-                if result["ai_success"]:
-                    self.stats["success_count"] += 1
-                else:
-                    self.stats["failed_count"] += 1
-                
-                # 处理间隔
-                if i < len(urls):
-                    self.log(f"等待5秒后处理下一个URL...")
-                    time.sleep(5)
+                if (result.get("stalled_stage") or result.get("auth_failed")) and attempts < douyin_watchdog.MAX_REQUEUE:
+                    if result.get("stalled_stage"):
+                        self.watchdog.requeued(result["stalled_stage"])
+                    self.log(f"[{i}/{len(urls)}] 链接放到队尾重试")
+                    queue.append((i, url, attempts + 1))
+                    continue
+                self.tally(result)
+                if result["crawl_success"] and self.stats["first_result_seconds"] is None:
+                    self.stats["first_result_seconds"] = round(time.monotonic() - run_started, 3)
                     
             except KeyboardInterrupt:
                 self.log("用户中断了处理过程", "WARNING")
@@ -494,7 +555,11 @@ class UltimateCrawler:
                         "ai_success": stats["ai_success"],
                         "processing_time_seconds": round(duration, 2),
                         "start_time": stats["start_time"],
-                        "end_time": stats["end_time"]
+                        "end_time": stats["end_time"],
+                        "warmup": stats["warmup"],
+                        "first_result_seconds": stats["first_result_seconds"],
+                        "stages": self.watchdog.stats(),
+                        "cookie_lifecycle": self.cookie_lifecycle.stats
                     },
                     "results": stats["results"]
                 }, f, ensure_ascii=False, indent=2)
@@ -515,6 +580,11 @@ class UltimateCrawler:
         self.log(f"完整流程成功: {stats['success_count']} ✅")
         self.log(f"处理失败: {stats['failed_count']} ❌")
         self.log(f"总处理时长: {duration:.2f} 秒")
+        if stats["first_result_seconds"] is not None:
+            self.log(f"启动到首个结果: {stats['first_result_seconds']:.2f} 秒 (预热: {'开' if stats['warmup'] else '关'})")
+        self.log(f"Cookie获取 {self.cookie_lifecycle.stats['acquired']} 次, 复用 {self.cookie_lifecycle.stats['reused']} 次, 失效 {self.cookie_lifecycle.stats['invalidated']} 次")
+        for stage, counts in self.watchdog.stats().items():
+            self.log(f"阶段 {stage}: 执行 {counts['runs']} 次, 超时 {counts['timeouts']} 次, 重排 {counts['requeued']} 次")
         
         if stats["total_urls"] > 0:
             success_rate = (stats["success_count"] / stats["total_urls"] * 100)
@@ -8,7 +8,6 @@
 import os
 import sys
 import json
-import time
 from datetime import datetime
 from urllib.parse import urlparse, unquote
 from typing import List, Dict, Optional
@@ -16,6 +15,9 @@ from typing import List, Dict, Optional
 # 导入所需的模块
 try:
     # 导入本地的抖音模块
+    import douyin_async
+    import douyin_config_cache
+    import douyin_ratelimit
     import douyin_request as request
     import douyin_cookies as cookies  
     import douyin_util as util
@@ -23,6 +25,9 @@ except ImportError:
     print("❌ 找不到所需的模块，尝试使用相对路径导入...")
     sys.path.insert(0, os.path.dirname(__file__))
     try:
+        import douyin_async
+        import douyin_config_cache
+        import douyin_ratelimit
         import douyin_request as request
         import douyin_cookies as cookies  
         import douyin_util as util
@@ -77,8 +82,6 @@ class DouyinVideoURLGetter:
         print(f"📥 开始获取用户 {sec_user_id} 的视频作品...")
         
         max_cursor = 0
-        retry_count = 0
-        max_retry = 5
         all_videos = []
         
         while self.has_more:
@@ -100,16 +103,9 @@ class DouyinVideoURLGetter:
                 # 发送请求
                 resp = self.request.getJSON(uri, params)
                 if not resp:
-                    retry_count += 1
-                    print(f"⚠️ 请求失败，第 {retry_count}/{max_retry} 次重试...")
-                    if retry_count >= max_retry:
-                        print("❌ 达到最大重试次数，停止获取")
-                        break
-                    time.sleep(2)  # 等待2秒后重试
-                    continue
-                
-                # 重置重试计数
-                retry_count = 0
+                    # 超时、限流、空响应等临时性错误getJSON已按重试策略重试过
+                    print(f"❌ 获取视频列表失败: {resp.error}")
+                    break
                 
                 # 获取下一页的cursor
                 max_cursor = resp.get('max_cursor', 0)
@@ -139,21 +135,72 @@ class DouyinVideoURLGetter:
                     print(f"🛑 已达到设定的最大视频数量 {max_videos}")
                     break
                 
-                # 添加延迟，避免请求过快
-                time.sleep(1)
-                
             except Exception as e:
                 print(f"❌ 获取视频列表失败: {e}")
-                retry_count += 1
-                if retry_count >= max_retry:
-                    print("❌ 达到最大重试次数，停止获取")
-                    break
-                time.sleep(2)
+                break
         
         print(f"✅ 获取完成，共获取到 {len(all_videos)} 个视频作品")
         self.results = all_videos
         return all_videos
     
+    async def get_user_videos_async(self, sec_user_id: str, max_videos: int = 0, client=None) -> List[Dict]:
+        """
+        异步获取用户的所有视频作品URL，逻辑与get_user_videos一致
+        client为共享的douyin_async.AsyncRequest，多个用户可用asyncio.gather并发获取
+        """
+        print(f"📥 开始获取用户 {sec_user_id} 的视频作品...")
+        
+        own_client = client is None
+        if own_client:
+            client = douyin_async.AsyncRequest(request=self.request)
+        
+        max_cursor = 0
+        has_more = True
+        all_videos = []
+        
+        try:
+            while has_more:
+                uri = '/aweme/v1/web/aweme/post/'
+                params = {
+                    "publish_video_strategy_type": 2,
+                    "max_cursor": max_cursor,
+                    "locate_query": False,
+                    'show_live_replay_strategy': 1,
+                    'need_time_list': 0,
+                    'time_list_query': 0,
+                    'whale_cut_token': '',
+                    'count': 18,
+                    "sec_user_id": sec_user_id
+                }
+                
+                resp = await client.getJSON(uri, params)
+                if not resp:
+                    # 临时性错误getJSON已按重试策略重试过
+                    print(f"❌ 获取视频列表失败: {resp.error}")
+                    break
+                
+                max_cursor = resp.get('max_cursor', 0)
+                has_more = resp.get('has_more', 0)
+                
+                aweme_list = resp.get('aweme_list', [])
+                if not aweme_list:
+                    print("ℹ️ 未找到更多作品")
+                    break
+                
+                page_videos = [v for v in map(self.extract_video_info, aweme_list) if v]
+                all_videos.extend(page_videos)
+                print(f"🔄 已获取 {len(all_videos)} 个视频, 是否继续: {has_more}")
+                
+                if max_videos > 0 and len(all_videos) >= max_videos:
+                    print(f"🛑 已达到设定的最大视频数量 {max_videos}")
+                    break
+        finally:
+            if own_client:
+                await client.close()
+        
+        print(f"✅ 获取完成，共获取到 {len(all_videos)} 个视频作品")
+        return all_videos
+    
     def extract_video_info(self, item: Dict) -> Optional[Dict]:
         """从作品数据中提取视频信息"""
         try:
@@ -245,8 +292,8 @@ def load_cookie_from_config(cookie_config_file: str = 'config/cookie.json') -> s
             print(f"⚠️ Cookie配置文件 {cookie_config_file} 不存在")
             return ''
         
-        with open(cookie_config_file, 'r', encoding='utf-8') as f:
-            cookie_json = json.load(f)
+        # 经过配置缓存，文件没有变化时不重新解析
+        cookie_json = douyin_config_cache.read_json(cookie_config_file)
             
         if isinstance(cookie_json, dict):
             # 如果是JSON对象，尝试提取cookie字段
@@ -339,6 +386,8 @@ def main():
     
     # 处理每个用户链接
     for i, url in enumerate(urls, 1):
+        # 按'url'配额控制链接间的节奏，处理耗时已超过间隔时不再额外等待
+        douyin_ratelimit.acquire('url')
         print(f"\n[{i}/{len(urls)}] 开始处理链接: {url}")
         print("-" * 40)
         
@@ -359,11 +408,6 @@ def main():
                 print(f"{j}. {video['url']}")
         else:
             print("❌ 未获取到视频数据")
-        
-        # 添加延时，避免请求过快
-        if i < len(urls):
-            print("\n⏱️ 等待5秒后处理下一个链接...")
-            time.sleep(5)
     
     print("\n✅ 所有链接处理完成!")
 
@@ -8,7 +8,7 @@
 import os
 import sys
 import json
-import time
+import asyncio
 import requests
 from datetime import datetime
 from urllib.parse import urlparse, unquote
@@ -17,6 +17,11 @@ from typing import List, Dict, Optional, Tuple
 # 导入所需的模块
 try:
     # 导入本地的抖音模块
+    import douyin_async
+    import douyin_config_cache
+    import douyin_ratelimit
+    import douyin_http
+    import douyin_singleflight
     import douyin_request as request
     import douyin_cookies as cookies  
     import douyin_util as util
@@ -24,6 +29,11 @@ except ImportError:
     print("❌ 找不到所需的模块，尝试使用相对路径导入...")
     sys.path.insert(0, os.path.dirname(__file__))
     try:
+        import douyin_async
+        import douyin_config_cache
+        import douyin_ratelimit
+        import douyin_http
+        import douyin_singleflight
         import douyin_request as request
         import douyin_cookies as cookies  
         import douyin_util as util
@@ -97,9 +107,14 @@ class DouyinVideoURLGetter:
         Returns:
             视频大小（字节数）
         """
+        # 同一视频并发查询时只探测一次
+        return douyin_singleflight.group('video_size').do(url, lambda: self.probe_video_size(url))
+    
+    def probe_video_size(self, url: str) -> int:
+        """依次用HEAD、Range请求、流式GET探测视频大小"""
         try:
-            # 仅发送HEAD请求获取文件大小
-            response = requests.head(
+            # 仅发送HEAD请求获取文件大小（共享连接池，同一CDN host复用连接）
+            response = douyin_http.head(
                 url, 
                 headers=self.headers, 
                 timeout=self.timeout,
@@ -117,32 +132,33 @@ class DouyinVideoURLGetter:
             range_headers = self.headers.copy()
             range_headers["Range"] = "bytes=0-1"  # 只请求前两个字节
             
-            response = requests.get(
+            with douyin_http.get(
                 url, 
                 headers=range_headers, 
                 timeout=self.timeout,
                 stream=True
-            )
-            
-            # 检查Content-Range头
-            if response.status_code == 206:
-                content_range = response.headers.get('Content-Range')
-                if content_range:
-                    # Content-Range格式: bytes 0-1/1234567
-                    total_size = content_range.split('/')[-1]
-                    if total_size.isdigit():
-                        return int(total_size)
+            ) as response:
+                # 检查Content-Range头
+                if response.status_code == 206:
+                    # 读完这两个字节，连接才会放回连接池；未读完的流关闭时连接会被断开
+                    response.content
+                    content_range = response.headers.get('Content-Range')
+                    if content_range:
+                        # Content-Range格式: bytes 0-1/1234567
+                        total_size = content_range.split('/')[-1]
+                        if total_size.isdigit():
+                            return int(total_size)
             
             # 尝试最后一种方法：使用requests的stream功能获取总大小
-            response = requests.get(
+            # 不读取响应体(完整视频)，关闭时这条连接直接断开，不会放回连接池
+            with douyin_http.get(
                 url, 
                 headers=self.headers, 
                 timeout=self.timeout,
                 stream=True
-            )
-            
-            if 'Content-Length' in response.headers:
-                return int(response.headers['Content-Length'])
+            ) as response:
+                if 'Content-Length' in response.headers:
+                    return int(response.headers['Content-Length'])
             
             # 如果以上方法都失败，返回-1表示无法获取大小
             print(f"⚠️ 无法获取视频大小: {url}")
@@ -155,6 +171,49 @@ class DouyinVideoURLGetter:
             print(f"⚠️ 获取视频大小失败: {e}")
             return -1
     
+    async def get_video_size_async(self, url: str, client) -> int:
+        """
+        get_video_size的异步版本，复用client的连接池
+        """
+        return await douyin_singleflight.group('video_size').do_async(
+            url, lambda: self.probe_video_size_async(url, client))
+    
+    async def probe_video_size_async(self, url: str, client) -> int:
+        try:
+            session = client.get_session()
+            head_url, headers = douyin_http.redirect_host(url, self.headers)
+            async with session.head(head_url, headers=headers, allow_redirects=True) as response:
+                content_length = response.headers.get('Content-Length')
+                if response.status == 200 and content_length:
+                    return int(content_length)
+            
+            range_headers = self.headers.copy()
+            range_headers["Range"] = "bytes=0-1"
+            range_url, range_headers = douyin_http.redirect_host(url, range_headers)
+            async with session.get(range_url, headers=range_headers) as response:
+                if response.status == 206:
+                    # 读完这两个字节，连接才会放回连接池
+                    await response.read()
+                content_range = response.headers.get('Content-Range')
+                if response.status == 206 and content_range:
+                    total_size = content_range.split('/')[-1]
+                    if total_size.isdigit():
+                        return int(total_size)
+            
+            # 最后用流式GET读取Content-Length，不读取响应体，这条连接会被断开而不是放回连接池
+            get_url, headers = douyin_http.redirect_host(url, self.headers)
+            async with session.get(get_url, headers=headers) as response:
+                content_length = response.headers.get('Content-Length')
+                if content_length:
+                    return int(content_length)
+            
+            print(f"⚠️ 无法获取视频大小: {url}")
+            return -1
+            
+        except Exception as e:
+            print(f"⚠️ 获取视频大小失败: {e}")
+            return -1
+    
     def get_formatted_size(self, size_in_bytes: int) -> str:
         """
         将字节大小转换为人类可读格式
@@ -185,8 +244,6 @@ class DouyinVideoURLGetter:
         print(f"📥 开始获取用户 {sec_user_id} 的视频作品...")
         
         max_cursor = 0
-        retry_count = 0
-        max_retry = 5
         all_videos = []
         
         while self.has_more:
@@ -208,16 +265,9 @@ class DouyinVideoURLGetter:
                 # 发送请求
                 resp = self.request.getJSON(uri, params)
                 if not resp:
-                    retry_count += 1
-                    print(f"⚠️ 请求失败，第 {retry_count}/{max_retry} 次重试...")
-                    if retry_count >= max_retry:
-                        print("❌ 达到最大重试次数，停止获取")
-                        break
-                    time.sleep(2)  # 等待2秒后重试
-                    continue
-                
-                # 重置重试计数
-                retry_count = 0
+                    # 超时、限流、空响应等临时性错误getJSON已按重试策略重试过
+                    print(f"❌ 获取视频列表失败: {resp.error}")
+                    break
                 
                 # 获取下一页的cursor
                 max_cursor = resp.get('max_cursor', 0)
@@ -252,21 +302,79 @@ class DouyinVideoURLGetter:
                     print(f"🛑 已达到设定的最大视频数量 {max_videos}")
                     break
                 
-                # 添加延迟，避免请求过快
-                time.sleep(1)
-                
             except Exception as e:
                 print(f"❌ 获取视频列表失败: {e}")
-                retry_count += 1
-                if retry_count >= max_retry:
-                    print("❌ 达到最大重试次数，停止获取")
-                    break
-                time.sleep(2)
+                break
         
         print(f"✅ 获取完成，共获取到 {len(all_videos)} 个视频作品")
         self.results = all_videos
         return all_videos
     
+    async def get_user_videos_async(self, sec_user_id: str, max_videos: int = 0, client=None) -> List[Dict]:
+        """
+        异步获取用户的所有视频作品URL，逻辑与get_user_videos一致
+        client为共享的douyin_async.AsyncRequest，多个用户可用asyncio.gather并发获取
+        """
+        print(f"📥 开始获取用户 {sec_user_id} 的视频作品...")
+        
+        own_client = client is None
+        if own_client:
+            client = douyin_async.AsyncRequest(request=self.request)
+        
+        max_cursor = 0
+        has_more = True
+        all_videos = []
+        
+        try:
+            while has_more:
+                uri = '/aweme/v1/web/aweme/post/'
+                params = {
+                    "publish_video_strategy_type": 2,
+                    "max_cursor": max_cursor,
+                    "locate_query": False,
+                    'show_live_replay_strategy': 1,
+                    'need_time_list': 0,
+                    'time_list_query': 0,
+                    'whale_cut_token': '',
+                    'count': 18,
+                    "sec_user_id": sec_user_id
+                }
+                
+                resp = await client.getJSON(uri, params)
+                if not resp:
+                    # 临时性错误getJSON已按重试策略重试过
+                    print(f"❌ 获取视频列表失败: {resp.error}")
+                    break
+                
+                max_cursor = resp.get('max_cursor', 0)
+                has_more = resp.get('has_more', 0)
+                
+                aweme_list = resp.get('aweme_list', [])
+                if not aweme_list:
+                    print("ℹ️ 未找到更多作品")
+                    break
+                
+                page_videos = [v for v in map(self.extract_video_info, aweme_list) if v]
+
+                # 并发获取本页视频大小
+                if page_videos:
+                    sizes = await asyncio.gather(*[self.get_video_size_async(v['url'], client) for v in page_videos])
+                    for video_info, video_size in zip(page_videos, sizes):
+                        video_info['size_bytes'] = video_size
+                        video_info['size_formatted'] = self.get_formatted_size(video_size)
+                all_videos.extend(page_videos)
+                print(f"🔄 已获取 {len(all_videos)} 个视频, 是否继续: {has_more}")
+                
+                if max_videos > 0 and len(all_videos) >= max_videos:
+                    print(f"🛑 已达到设定的最大视频数量 {max_videos}")
+                    break
+        finally:
+            if own_client:
+                await client.close()
+        
+        print(f"✅ 获取完成，共获取到 {len(all_videos)} 个视频作品")
+        return all_videos
+    
     def extract_video_info(self, item: Dict) -> Optional[Dict]:
         """从作品数据中提取视频信息"""
         try:
@@ -368,8 +476,8 @@ def load_cookie_from_config(cookie_config_file: str = 'config/cookie.json') -> s
             print(f"⚠️ Cookie配置文件 {cookie_config_file} 不存在")
             return ''
         
-        with open(cookie_config_file, 'r', encoding='utf-8') as f:
-            cookie_json = json.load(f)
+        # 经过配置缓存，文件没有变化时不重新解析
+        cookie_json = douyin_config_cache.read_json(cookie_config_file)
             
         if isinstance(cookie_json, dict):
             # 如果是JSON对象，尝试提取cookie字段
@@ -464,6 +572,8 @@ def main():
     
     # 处理每个用户链接
     for i, url in enumerate(urls, 1):
+        # 按'url'配额控制链接间的节奏，处理耗时已超过间隔时不再额外等待
+        douyin_ratelimit.acquire('url')
         print(f"\n[{i}/{len(urls)}] 开始处理链接: {url}")
         print("-" * 50)
         
@@ -484,11 +594,6 @@ def main():
                 print(f"{j}. {video['desc']} - {video.get('size_formatted', '未知大小')}")
         else:
             print("❌ 未获取到视频数据")
-        
-        # 添加延时，避免请求过快
-        if i < len(urls):
-            print("\n⏱️ 等待5秒后处理下一个链接...")
-            time.sleep(5)
     
     print("\n✅ 所有链接处理完成!")
 